@@ -1,15 +1,436 @@
+import logging
+import time
+from functools import partial
+
+import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+
+from . import websocket_api
+from .const import (
+    CONF_CPU_BUDGET,
+    CONF_MEMORY_CAP,
+    DEFAULT_CPU_BUDGET,
+    DEFAULT_EMA_DESIRED_TIME_TO_95,
+    DEFAULT_EMA_HORIZONS,
+    DEFAULT_ENTRY_MEMORY_CAP,
+    DEFAULT_FIR_METHOD,
+    DEFAULT_HAMPEL_MODE,
+    DEFAULT_HAMPEL_THRESHOLD,
+    DEFAULT_HAMPEL_WINDOW,
+    DEFAULT_HOLT_PREDICTION_HORIZON,
+    DEFAULT_HOLT_TIME_TO_95,
+    DEFAULT_HOLT_TREND_TIME_TO_95,
+    DEFAULT_INPUT_AGGREGATION,
+    DEFAULT_INTEGRATION_METHOD,
+    DEFAULT_LOW_PASS,
+    DEFAULT_MEDIAN_SIZE,
+    DEFAULT_MEMORY_CAP,
+    DEFAULT_SAMPLE_LOG_SIZE,
+    DEFAULT_SHADOW_PIPELINES,
+    DEFAULT_SLOPE_WINDOW,
+    DEFAULT_SLOPE_WINDOW_UNIT,
+    DEFAULT_STALE_BEHAVIOR,
+    DEFAULT_STALE_TIMEOUT,
+    DEFAULT_THRESHOLD_DWELL,
+    DEFAULT_THRESHOLD_ENABLED,
+    DEFAULT_THRESHOLD_LOWER,
+    DEFAULT_THRESHOLD_UPPER,
+    DEFAULT_UNAVAILABLE_BEHAVIOR,
+    DOMAIN,
+    FIR_METHOD_NONE,
+    HAMPEL_MODE_NONE,
+    HAMPEL_MODE_REPLACE_MEDIAN,
+    INTEGRATION_METHOD_NONE,
+    SHADOW_SETTINGS,
+    STALE_BEHAVIOR_DECAY,
+)
+from .custom_sensors.ema_sensor import EmaStage
+from .custom_sensors.fir_sensor import FirStage, fir_coefficients
+from .custom_sensors.hampel_sensor import HampelStage
+from .custom_sensors.holt_sensor import HoltStage
+from .custom_sensors.integration_sensor import IntegrationStage
+from .custom_sensors.lowpass_sensor import LowpassStage
+from .custom_sensors.median_sensor import MedianSketchStage, MedianStage
+from .custom_sensors.slope_sensor import SlopeStage
+from .custom_sensors.threshold_sensor import ThresholdStage
+from .memory import estimate_memory
+from .pipeline import PipelineManager, input_stage_key, sample_log_path
+from .sample_log import SampleLog
+from .utils.misc import (
+    generate_md5_hash,
+    get_config_value,
+    parse_horizons,
+    parse_shadow_pipelines,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+PLATFORMS = ["sensor", "binary_sensor"]
 
-from .const import DOMAIN
+# Integration-wide settings, the pipelines themselves are set up from the UI
+CONFIG_SCHEMA = vol.Schema(
+    {
+        DOMAIN: vol.Schema(
+            {
+                vol.Optional(CONF_CPU_BUDGET, default=DEFAULT_CPU_BUDGET): vol.All(
+                    vol.Coerce(float), vol.Range(min=0.1, max=100)
+                ),
+                vol.Optional(CONF_MEMORY_CAP, default=DEFAULT_MEMORY_CAP): vol.All(
+                    vol.Coerce(int), vol.Range(min=0)
+                ),
+            }
+        )
+    },
+    extra=vol.ALLOW_EXTRA,
+)
+
+# Stages that used to have a unique_id based on the input sensor hash
+LEGACY_STAGE_NAMES = ("lowpass", "median", "ema")
+
+
+async def async_setup(hass: HomeAssistant, config) -> bool:
+    """Set up the pipeline manager shared by every config entry."""
+    conf = config.get(DOMAIN, {})
+    memory_cap = conf.get(CONF_MEMORY_CAP, DEFAULT_MEMORY_CAP)
+    manager = PipelineManager(
+        hass,
+        cpu_budget=conf.get(CONF_CPU_BUDGET, DEFAULT_CPU_BUDGET),
+        memory_cap=memory_cap * 1024 if memory_cap else None,
+    )
+
+    # Restore the state of all pipelines in one pass before any entry is set up
+    await manager.async_load()
+    hass.data[DOMAIN] = manager
+
+    # Full rate streams of the stage outputs for websocket clients
+    websocket_api.async_setup(hass)
+    return True
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Smoothing Analytics Sensors from a config entry."""
-    await hass.config_entries.async_forward_entry_setups(entry, ["sensor"])
+    start = time.perf_counter()
+
+    pipeline = _async_build_pipeline(hass.data[DOMAIN], entry)
+
+    # Rebuild the filters from the raw sample log instead of the stored state
+    sample_log_size = _sample_log_size(hass, entry)
+    if sample_log_size and not pipeline.degraded:
+        await pipeline.async_open_sample_log(sample_log_size)
+
+    # Stages are shared by their settings, so rebuild the pipeline when they change
+    entry.async_on_unload(entry.add_update_listener(_async_update_listener))
+
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+
+    pipeline.setup_time = time.perf_counter() - start
+    _LOGGER.debug(
+        f"Set up pipeline of {entry.entry_id} in {pipeline.setup_time * 1000:.1f} ms"
+    )
     return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
-    return await hass.config_entries.async_forward_entry_unload(entry, "sensor")
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok:
+        hass.data[DOMAIN].async_remove_pipeline(entry.entry_id)
+    return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Delete the raw sample log of a removed config entry."""
+    key = _input_stage_key(entry)
+
+    # The log belongs to the shared input stage, keep it for other entries
+    for other_entry in hass.config_entries.async_entries(DOMAIN):
+        if (
+            other_entry.entry_id != entry.entry_id
+            and _input_stage_key(other_entry) == key
+        ):
+            return
+
+    await hass.async_add_executor_job(SampleLog.remove, sample_log_path(hass, key))
+
+
+def _input_stage_key(entry):
+    """Return the key of the input stage of a config entry."""
+    return input_stage_key(
+        entry.data.get("input_sensor"),
+        entry.data.get("input_aggregation", DEFAULT_INPUT_AGGREGATION),
+        get_config_value(entry, "unavailable_behavior", DEFAULT_UNAVAILABLE_BEHAVIOR),
+        _stale_decay_timeout(entry),
+    )
+
+
+def _sample_log_size(hass, entry):
+    """Return the largest sample log size of the entries sharing the input stage.
+
+    Sizing the shared log up front keeps it from being started over whenever
+    the entries are set up in another order.
+    """
+    key = _input_stage_key(entry)
+    return max(
+        int(get_config_value(other_entry, "sample_log_size", DEFAULT_SAMPLE_LOG_SIZE))
+        for other_entry in hass.config_entries.async_entries(DOMAIN)
+        if other_entry.disabled_by is None and _input_stage_key(other_entry) == key
+    )
+
+
+def _stale_decay_timeout(entry):
+    """Return the stale timeout of a config entry decaying its stale input, else 0."""
+    stale_behavior = get_config_value(entry, "stale_behavior", DEFAULT_STALE_BEHAVIOR)
+    if stale_behavior != STALE_BEHAVIOR_DECAY:
+        return 0
+    return get_config_value(entry, "stale_timeout", DEFAULT_STALE_TIMEOUT)
+
+
+async def async_migrate_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Migrate an old config entry."""
+    if entry.version == 1:
+        # Unique ids used to be based on the input sensor only, which made two
+        # entries on the same input collide. Base them on the entry instead.
+        sensor_hash = generate_md5_hash(entry.data.get("input_sensor"))
+
+        @callback
+        def _migrate_unique_id(entity_entry):
+            for stage_name in LEGACY_STAGE_NAMES:
+                if entity_entry.unique_id == f"sas_{stage_name}_{sensor_hash}":
+                    return {"new_unique_id": f"sas_{stage_name}_{entry.entry_id}"}
+            return None
+
+        await er.async_migrate_entries(hass, entry.entry_id, _migrate_unique_id)
+        hass.config_entries.async_update_entry(entry, version=2)
+        _LOGGER.debug(f"Migrated config entry {entry.entry_id} to version 2")
+
+    if entry.version == 2:
+        # The input sensor became a list of input sensors
+        data = {**entry.data, "input_sensor": [entry.data.get("input_sensor")]}
+        hass.config_entries.async_update_entry(entry, data=data, version=3)
+        _LOGGER.debug(f"Migrated config entry {entry.entry_id} to version 3")
+
+    return True
+
+
+async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the config entry when its options change."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
+@callback
+def _async_build_pipeline(manager, entry):
+    """Acquire the lowpass, median, EMA and optional output stages of a config entry."""
+    pipeline = manager.async_create_pipeline(entry)
+
+    lowpass_time_constant = get_config_value(
+        entry, "lowpass_time_constant", DEFAULT_LOW_PASS
+    )
+
+    median_sampling_size = get_config_value(
+        entry, "median_sampling_size", DEFAULT_MEDIAN_SIZE
+    )
+
+    desired_time_to_95 = get_config_value(
+        entry, "desired_time_to_95", DEFAULT_EMA_DESIRED_TIME_TO_95
+    )
+
+    # Additional EMA horizons share the stage of the primary one
+    ema_horizons = tuple(
+        horizon
+        for horizon in parse_horizons(
+            get_config_value(entry, "ema_horizons", DEFAULT_EMA_HORIZONS)
+        )
+        if horizon != desired_time_to_95
+    )
+
+    unavailable_behavior = get_config_value(
+        entry, "unavailable_behavior", DEFAULT_UNAVAILABLE_BEHAVIOR
+    )
+
+    # Identical stages of other entries on the same inputs are shared
+    input_stage = pipeline.async_add_input(
+        entry.data.get("input_sensor"),
+        entry.data.get("input_aggregation", DEFAULT_INPUT_AGGREGATION),
+        unavailable_behavior,
+        _stale_decay_timeout(entry),
+    )
+
+    # Input sensors that stop reporting without becoming unavailable
+    stale_timeout = get_config_value(entry, "stale_timeout", DEFAULT_STALE_TIMEOUT)
+    if stale_timeout:
+        pipeline.async_track_stale(
+            stale_timeout,
+            get_config_value(entry, "stale_behavior", DEFAULT_STALE_BEHAVIOR),
+        )
+
+    lowpass_stage = pipeline.async_add_stage(
+        "lowpass", LowpassStage, input_stage, time_constant=lowpass_time_constant
+    )
+
+    # Fall back to a constant-memory median, without the sample log, when the
+    # buffers would exceed the memory cap of the entry or of the integration
+    memory_budget = manager.memory_budget(
+        get_config_value(entry, "memory_cap", DEFAULT_ENTRY_MEMORY_CAP) * 1024
+    )
+    memory_estimate = estimate_memory(
+        lambda key, default: get_config_value(entry, key, default)
+    )
+    if memory_budget is not None and memory_estimate > memory_budget:
+        _LOGGER.warning(
+            f"The buffers of {entry.title} would use {memory_estimate} bytes, "
+            f"over the memory cap of {memory_budget} bytes. "
+            "Approximating the median and disabling the sample log"
+        )
+        pipeline.degraded = True
+
+    # Outliers of the lowpass output are replaced before the moving median, or
+    # the Hampel stage takes the place of the median altogether
+    hampel_mode = get_config_value(entry, "hampel_mode", DEFAULT_HAMPEL_MODE)
+    hampel_params = {
+        "window": int(get_config_value(entry, "hampel_window", DEFAULT_HAMPEL_WINDOW)),
+        "threshold": get_config_value(
+            entry, "hampel_threshold", DEFAULT_HAMPEL_THRESHOLD
+        ),
+    }
+    median_cls = MedianSketchStage if pipeline.degraded else MedianStage
+
+    median_stage = _async_add_median_stages(
+        pipeline.async_add_stage,
+        lowpass_stage,
+        hampel_mode,
+        hampel_params,
+        median_cls,
+        int(median_sampling_size),
+    )
+    ema_stage = pipeline.async_add_stage(
+        "ema",
+        EmaStage,
+        median_stage,
+        desired_time_to_95=desired_time_to_95,
+        horizons=ema_horizons,
+    )
+
+    # Level and trend next to the EMA, to predict past the lag of the pipeline
+    holt_time_to_95 = get_config_value(
+        entry, "holt_time_to_95", DEFAULT_HOLT_TIME_TO_95
+    )
+    if holt_time_to_95:
+        pipeline.async_add_stage(
+            "holt",
+            HoltStage,
+            median_stage,
+            desired_time_to_95=holt_time_to_95,
+            trend_time_to_95=get_config_value(
+                entry, "holt_trend_time_to_95", DEFAULT_HOLT_TREND_TIME_TO_95
+            ),
+            prediction_horizon=get_config_value(
+                entry, "holt_prediction_horizon", DEFAULT_HOLT_PREDICTION_HORIZON
+            ),
+        )
+
+    # Polynomial-preserving or custom FIR smoothing next to the EMA, the
+    # coefficients are computed once here and shared with identical stages
+    if get_config_value(entry, "fir_method", DEFAULT_FIR_METHOD) != FIR_METHOD_NONE:
+        pipeline.async_add_stage(
+            "fir",
+            FirStage,
+            median_stage,
+            coefficients=fir_coefficients(
+                lambda key, default: get_config_value(entry, key, default)
+            ),
+        )
+
+    # Rate of change of the smoothed value, computed in the same update
+    slope_window = get_config_value(entry, "slope_window", DEFAULT_SLOPE_WINDOW)
+    if slope_window:
+        pipeline.async_add_stage(
+            "slope",
+            SlopeStage,
+            ema_stage,
+            window=slope_window,
+            window_unit=get_config_value(
+                entry, "slope_window_unit", DEFAULT_SLOPE_WINDOW_UNIT
+            ),
+        )
+
+    # Total of the unrounded smoothed value, e.g. energy from power
+    integration_method = get_config_value(
+        entry, "integration_method", DEFAULT_INTEGRATION_METHOD
+    )
+    if integration_method != INTEGRATION_METHOD_NONE:
+        pipeline.async_add_stage(
+            "integration", IntegrationStage, ema_stage, method=integration_method
+        )
+
+    # Binary output with hysteresis, only written when it flips
+    if get_config_value(entry, "threshold_enabled", DEFAULT_THRESHOLD_ENABLED):
+        pipeline.async_add_stage(
+            "threshold",
+            ThresholdStage,
+            ema_stage,
+            upper=get_config_value(entry, "threshold_upper", DEFAULT_THRESHOLD_UPPER),
+            lower=get_config_value(entry, "threshold_lower", DEFAULT_THRESHOLD_LOWER),
+            dwell=get_config_value(entry, "threshold_dwell", DEFAULT_THRESHOLD_DWELL),
+        )
+
+    # Shadow pipelines with alternative settings run off the same input, and
+    # are only compared with the live EMA output without publishing states
+    shadow_pipelines = parse_shadow_pipelines(
+        get_config_value(entry, "shadow_pipelines", DEFAULT_SHADOW_PIPELINES),
+        SHADOW_SETTINGS,
+    )
+    for index, overrides in enumerate(shadow_pipelines, start=1):
+        shadow = f"shadow_{index}"
+        settings = {
+            "lowpass_time_constant": lowpass_time_constant,
+            "median_sampling_size": median_sampling_size,
+            "desired_time_to_95": desired_time_to_95,
+            **overrides,
+        }
+        pipeline.async_add_shadow(shadow, settings)
+
+        shadow_lowpass_stage = pipeline.async_add_shadow_stage(
+            shadow,
+            "lowpass",
+            LowpassStage,
+            input_stage,
+            time_constant=settings["lowpass_time_constant"],
+        )
+        shadow_median_stage = _async_add_median_stages(
+            partial(pipeline.async_add_shadow_stage, shadow),
+            shadow_lowpass_stage,
+            hampel_mode,
+            hampel_params,
+            median_cls,
+            int(settings["median_sampling_size"]),
+        )
+        pipeline.async_add_shadow_stage(
+            shadow,
+            "ema",
+            EmaStage,
+            shadow_median_stage,
+            desired_time_to_95=settings["desired_time_to_95"],
+        )
+        pipeline.async_compare_shadow(shadow, "ema")
+
+    return pipeline
+
+
+@callback
+def _async_add_median_stages(
+    add_stage, lowpass_stage, hampel_mode, hampel_params, median_cls, sampling_size
+):
+    """Acquire the Hampel and moving median stages, return the last of them.
+
+    add_stage is the async_add_stage of a pipeline, or its async_add_shadow_stage
+    bound to a shadow pipeline.
+    """
+    upstream = lowpass_stage
+    if hampel_mode != HAMPEL_MODE_NONE:
+        upstream = add_stage("hampel", HampelStage, upstream, **hampel_params)
+        if hampel_mode == HAMPEL_MODE_REPLACE_MEDIAN:
+            return upstream
+
+    return add_stage("median", median_cls, upstream, sampling_size=sampling_size)
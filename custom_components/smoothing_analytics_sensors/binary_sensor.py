@@ -0,0 +1,17 @@
+import logging
+
+from .const import DOMAIN
+from .custom_sensors.threshold_sensor import ThresholdBinarySensor
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_setup_entry(hass, config_entry, async_add_entities):
+    """Set up Smoothing Analytics binary sensors from a config entry."""
+    pipeline = hass.data[DOMAIN].pipelines[config_entry.entry_id]
+
+    # Threshold outputs are optional
+    if "threshold" in pipeline.stages:
+        async_add_entities(
+            [ThresholdBinarySensor(pipeline, pipeline.stages["threshold"])]
+        )
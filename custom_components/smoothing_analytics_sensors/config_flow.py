@@ -5,21 +5,399 @@ from homeassistant import config_entries
 from homeassistant.core import callback
 from homeassistant.helpers.selector import selector
 
+from . import preview
 from .const import (
     DEFAULT_EMA_DESIRED_TIME_TO_95,
+    DEFAULT_EMA_HORIZONS,
+    DEFAULT_ENTRY_MEMORY_CAP,
+    DEFAULT_FIR_COEFFICIENTS,
+    DEFAULT_FIR_METHOD,
+    DEFAULT_FIR_POLYORDER,
+    DEFAULT_FIR_WINDOW,
+    DEFAULT_HAMPEL_MODE,
+    DEFAULT_HAMPEL_THRESHOLD,
+    DEFAULT_HAMPEL_WINDOW,
+    DEFAULT_HOLT_PREDICTION_HORIZON,
+    DEFAULT_HOLT_TIME_TO_95,
+    DEFAULT_HOLT_TREND_TIME_TO_95,
+    DEFAULT_IMPORT_STATISTICS,
+    DEFAULT_INPUT_AGGREGATION,
+    DEFAULT_INTEGRATION_METHOD,
     DEFAULT_LOW_PASS,
     DEFAULT_MEDIAN_SIZE,
+    DEFAULT_PUBLISH_INTERVAL,
+    DEFAULT_SAMPLE_LOG_SIZE,
+    DEFAULT_SHADOW_PIPELINES,
+    DEFAULT_SLOPE_WINDOW,
+    DEFAULT_SLOPE_WINDOW_UNIT,
+    DEFAULT_STALE_BEHAVIOR,
+    DEFAULT_STALE_TIMEOUT,
+    DEFAULT_THRESHOLD_DWELL,
+    DEFAULT_THRESHOLD_ENABLED,
+    DEFAULT_THRESHOLD_LOWER,
+    DEFAULT_THRESHOLD_UPPER,
+    DEFAULT_UNAVAILABLE_BEHAVIOR,
     DOMAIN,
+    FIR_METHOD_NONE,
+    FIR_METHODS,
+    HAMPEL_MODES,
+    INPUT_AGGREGATION_OPTIONS,
+    INTEGRATION_METHODS,
     NAME,
+    SHADOW_SETTINGS,
+    SLOPE_WINDOW_UNITS,
+    STALE_BEHAVIORS,
+    UNAVAILABLE_BEHAVIORS,
+)
+from .custom_sensors.fir_sensor import fir_coefficients
+from .memory import estimate_memory
+from .utils.misc import (
+    get_config_value,
+    parse_horizons,
+    parse_shadow_pipelines,
 )
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def _validate_pipeline_fields(hass, user_input, errors, entry_id=None):
+    """Validate the pipeline settings shared by the config and options flows."""
+    try:
+        parse_horizons(user_input.get("ema_horizons"))
+    except ValueError:
+        errors["ema_horizons"] = "invalid_horizons"
+
+    if user_input.get("threshold_enabled") and user_input.get(
+        "threshold_lower", DEFAULT_THRESHOLD_LOWER
+    ) > user_input.get("threshold_upper", DEFAULT_THRESHOLD_UPPER):
+        errors["threshold_lower"] = "invalid_hysteresis"
+
+    if user_input.get("fir_method", DEFAULT_FIR_METHOD) != FIR_METHOD_NONE:
+        try:
+            fir_coefficients(user_input.get)
+        except ValueError:
+            errors["fir_method"] = "invalid_fir"
+            return
+
+    try:
+        parse_shadow_pipelines(user_input.get("shadow_pipelines"), SHADOW_SETTINGS)
+    except ValueError:
+        errors["shadow_pipelines"] = "invalid_shadow_pipelines"
+        return
+
+    # Reject buffers that would not fit the memory caps, an entry already set
+    # up is replaced, so its own stages do not count. Before the first entry is
+    # set up there is no pipeline manager yet, and only the entry cap applies.
+    memory_estimate = estimate_memory(user_input.get)
+    entry_cap = user_input.get("memory_cap", DEFAULT_ENTRY_MEMORY_CAP) * 1024
+    manager = hass.data.get(DOMAIN)
+    if manager is not None:
+        memory_budget = manager.memory_budget(entry_cap, entry_id)
+    else:
+        memory_budget = entry_cap or None
+    if memory_budget is not None and memory_estimate > memory_budget:
+        errors["base"] = "memory_cap_exceeded"
+
+
+def _pipeline_fields(get_default):
+    """Return the form fields of the pipeline settings shared by the config and options flows."""
+    return {
+        vol.Optional(
+            "lowpass_time_constant",
+            default=get_default("lowpass_time_constant", DEFAULT_LOW_PASS),
+        ): selector(
+            {
+                "number": {
+                    "min": 1,
+                    "max": 60,
+                    "unit_of_measurement": "seconds",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "median_sampling_size",
+            default=get_default("median_sampling_size", DEFAULT_MEDIAN_SIZE),
+        ): selector(
+            {
+                "number": {
+                    "min": 1,
+                    "max": 60,
+                    "unit_of_measurement": "samples",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "hampel_mode",
+            default=get_default("hampel_mode", DEFAULT_HAMPEL_MODE),
+        ): selector(
+            {
+                "select": {
+                    "options": HAMPEL_MODES,
+                    "translation_key": "hampel_mode",
+                }
+            }
+        ),
+        vol.Optional(
+            "hampel_window",
+            default=get_default("hampel_window", DEFAULT_HAMPEL_WINDOW),
+        ): selector(
+            {
+                "number": {
+                    "min": 3,
+                    "max": 600,
+                    "unit_of_measurement": "samples",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "hampel_threshold",
+            default=get_default("hampel_threshold", DEFAULT_HAMPEL_THRESHOLD),
+        ): selector({"number": {"min": 0.5, "max": 10, "step": 0.1, "mode": "box"}}),
+        vol.Optional(
+            "desired_time_to_95",
+            default=get_default("desired_time_to_95", DEFAULT_EMA_DESIRED_TIME_TO_95),
+        ): selector(
+            {
+                "number": {
+                    "min": 1,
+                    "max": 600,
+                    "unit_of_measurement": "seconds",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "ema_horizons",
+            default=get_default("ema_horizons", DEFAULT_EMA_HORIZONS),
+        ): selector({"text": {}}),
+        vol.Optional(
+            "holt_time_to_95",
+            default=get_default("holt_time_to_95", DEFAULT_HOLT_TIME_TO_95),
+        ): selector(
+            {
+                "number": {
+                    "min": 0,
+                    "max": 600,
+                    "unit_of_measurement": "seconds",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "holt_trend_time_to_95",
+            default=get_default("holt_trend_time_to_95", DEFAULT_HOLT_TREND_TIME_TO_95),
+        ): selector(
+            {
+                "number": {
+                    "min": 1,
+                    "max": 3600,
+                    "unit_of_measurement": "seconds",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "holt_prediction_horizon",
+            default=get_default(
+                "holt_prediction_horizon", DEFAULT_HOLT_PREDICTION_HORIZON
+            ),
+        ): selector(
+            {
+                "number": {
+                    "min": 0,
+                    "max": 600,
+                    "unit_of_measurement": "seconds",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "fir_method",
+            default=get_default("fir_method", DEFAULT_FIR_METHOD),
+        ): selector(
+            {
+                "select": {
+                    "options": FIR_METHODS,
+                    "translation_key": "fir_method",
+                }
+            }
+        ),
+        vol.Optional(
+            "fir_window",
+            default=get_default("fir_window", DEFAULT_FIR_WINDOW),
+        ): selector(
+            {
+                "number": {
+                    "min": 2,
+                    "max": 101,
+                    "unit_of_measurement": "samples",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "fir_polyorder",
+            default=get_default("fir_polyorder", DEFAULT_FIR_POLYORDER),
+        ): selector(
+            {
+                "number": {
+                    "min": 0,
+                    "max": 6,
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "fir_coefficients",
+            default=get_default("fir_coefficients", DEFAULT_FIR_COEFFICIENTS),
+        ): selector({"text": {}}),
+        vol.Optional(
+            "slope_window",
+            default=get_default("slope_window", DEFAULT_SLOPE_WINDOW),
+        ): selector(
+            {
+                "number": {
+                    "min": 0,
+                    "max": 3600,
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "slope_window_unit",
+            default=get_default("slope_window_unit", DEFAULT_SLOPE_WINDOW_UNIT),
+        ): selector(
+            {
+                "select": {
+                    "options": SLOPE_WINDOW_UNITS,
+                    "translation_key": "slope_window_unit",
+                }
+            }
+        ),
+        vol.Optional(
+            "integration_method",
+            default=get_default("integration_method", DEFAULT_INTEGRATION_METHOD),
+        ): selector(
+            {
+                "select": {
+                    "options": INTEGRATION_METHODS,
+                    "translation_key": "integration_method",
+                }
+            }
+        ),
+        vol.Optional(
+            "threshold_enabled",
+            default=get_default("threshold_enabled", DEFAULT_THRESHOLD_ENABLED),
+        ): selector({"boolean": {}}),
+        vol.Optional(
+            "threshold_upper",
+            default=get_default("threshold_upper", DEFAULT_THRESHOLD_UPPER),
+        ): selector({"number": {"mode": "box", "step": "any"}}),
+        vol.Optional(
+            "threshold_lower",
+            default=get_default("threshold_lower", DEFAULT_THRESHOLD_LOWER),
+        ): selector({"number": {"mode": "box", "step": "any"}}),
+        vol.Optional(
+            "threshold_dwell",
+            default=get_default("threshold_dwell", DEFAULT_THRESHOLD_DWELL),
+        ): selector(
+            {
+                "number": {
+                    "min": 0,
+                    "max": 3600,
+                    "unit_of_measurement": "seconds",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "unavailable_behavior",
+            default=get_default("unavailable_behavior", DEFAULT_UNAVAILABLE_BEHAVIOR),
+        ): selector(
+            {
+                "select": {
+                    "options": UNAVAILABLE_BEHAVIORS,
+                    "translation_key": "unavailable_behavior",
+                }
+            }
+        ),
+        vol.Optional(
+            "stale_timeout",
+            default=get_default("stale_timeout", DEFAULT_STALE_TIMEOUT),
+        ): selector(
+            {
+                "number": {
+                    "min": 0,
+                    "max": 86400,
+                    "unit_of_measurement": "seconds",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "stale_behavior",
+            default=get_default("stale_behavior", DEFAULT_STALE_BEHAVIOR),
+        ): selector(
+            {
+                "select": {
+                    "options": STALE_BEHAVIORS,
+                    "translation_key": "stale_behavior",
+                }
+            }
+        ),
+        vol.Optional(
+            "publish_interval",
+            default=get_default("publish_interval", DEFAULT_PUBLISH_INTERVAL),
+        ): selector(
+            {
+                "number": {
+                    "min": 0,
+                    "max": 3600,
+                    "unit_of_measurement": "seconds",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "sample_log_size",
+            default=get_default("sample_log_size", DEFAULT_SAMPLE_LOG_SIZE),
+        ): selector(
+            {
+                "number": {
+                    "min": 0,
+                    "max": 1000000,
+                    "unit_of_measurement": "samples",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "memory_cap",
+            default=get_default("memory_cap", DEFAULT_ENTRY_MEMORY_CAP),
+        ): selector(
+            {
+                "number": {
+                    "min": 0,
+                    "max": 1048576,
+                    "unit_of_measurement": "KiB",
+                    "mode": "box",
+                }
+            }
+        ),
+        vol.Optional(
+            "import_statistics",
+            default=get_default("import_statistics", DEFAULT_IMPORT_STATISTICS),
+        ): selector({"boolean": {}}),
+    }
+
+
 class SmoothingAnalyticsConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Config flow for Smoothing Analytics Sensors."""
 
-    VERSION = 1
+    VERSION = 3
 
     async def async_step_user(self, user_input=None):
         """Handle the initial step."""
@@ -30,7 +408,9 @@ class SmoothingAnalyticsConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             # Validate input_sensor and other necessary fields
             if not user_input.get("input_sensor"):
                 self._errors["input_sensor"] = "required"
-            else:
+            _validate_pipeline_fields(self.hass, user_input, self._errors)
+
+            if not self._errors:
                 # Create the configuration with device_name as title
                 return self.async_create_entry(
                     title=user_input.get("device_name", NAME),
@@ -41,45 +421,20 @@ class SmoothingAnalyticsConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         data_schema = vol.Schema(
             {
                 vol.Required("input_sensor"): selector(
-                    {"entity": {"domain": "sensor"}}
-                ),
-                vol.Optional("device_name", default=NAME): str,
-                vol.Optional(
-                    "lowpass_time_constant", default=DEFAULT_LOW_PASS
-                ): selector(
-                    {
-                        "number": {
-                            "min": 1,
-                            "max": 60,
-                            "unit_of_measurement": "seconds",
-                            "mode": "box",
-                        }
-                    }
-                ),
-                vol.Optional(
-                    "median_sampling_size", default=DEFAULT_MEDIAN_SIZE
-                ): selector(
-                    {
-                        "number": {
-                            "min": 1,
-                            "max": 60,
-                            "unit_of_measurement": "samples",
-                            "mode": "box",
-                        }
-                    }
+                    {"entity": {"domain": "sensor", "multiple": True}}
                 ),
                 vol.Optional(
-                    "desired_time_to_95", default=DEFAULT_EMA_DESIRED_TIME_TO_95
+                    "input_aggregation", default=DEFAULT_INPUT_AGGREGATION
                 ): selector(
                     {
-                        "number": {
-                            "min": 10,
-                            "max": 600,
-                            "unit_of_measurement": "seconds",
-                            "mode": "box",
+                        "select": {
+                            "options": INPUT_AGGREGATION_OPTIONS,
+                            "translation_key": "input_aggregation",
                         }
                     }
                 ),
+                vol.Optional("device_name", default=NAME): str,
+                **_pipeline_fields(lambda key, default: default),
             }
         )
 
@@ -101,72 +456,107 @@ class SmoothingAnalyticsOptionsFlow(config_entries.OptionsFlow):
     def __init__(self, config_entry):
         """Initialize options flow."""
         self._config_entry = config_entry
+        self._history = None
+        self._current_metrics = None
 
     async def async_step_init(self, user_input=None):
         """Handle options step."""
+        errors = {}
+        preview_text = ""
+        defaults = self._config_entry
+
         if user_input is not None:
-            # Update the device name in options flow
-            return self.async_create_entry(
-                title=user_input.get("device_name", self._config_entry.title),
-                data=user_input,
+            _validate_pipeline_fields(
+                self.hass, user_input, errors, self._config_entry.entry_id
             )
 
-        # Use default values from options and translations
+            if not errors and user_input.pop("preview", False):
+                # Show the form again with the submitted settings and their preview
+                preview_text = await self._async_preview(user_input)
+                defaults = None
+            elif not errors:
+                # Update the device name in options flow
+                return self.async_create_entry(
+                    title=user_input.get("device_name", self._config_entry.title),
+                    data=user_input,
+                )
+
+        # Use the current settings of the entry, or the previewed ones, as defaults
+        def get_default(key, default):
+            if defaults is None:
+                return user_input.get(key, default)
+            return get_config_value(defaults, key, default)
+
         data_schema = vol.Schema(
             {
                 vol.Optional(
                     "device_name",
-                    default=self._config_entry.options.get("device_name", NAME),
-                ): str,
-                vol.Optional(
-                    "lowpass_time_constant",
-                    default=self._config_entry.options.get(
-                        "lowpass_time_constant", DEFAULT_LOW_PASS
+                    default=(
+                        user_input.get("device_name", NAME)
+                        if defaults is None
+                        else self._config_entry.options.get("device_name", NAME)
                     ),
-                ): selector(
-                    {
-                        "number": {
-                            "min": 1,
-                            "max": 60,
-                            "unit_of_measurement": "seconds",
-                            "mode": "box",
-                        }
-                    }
-                ),
-                vol.Optional(
-                    "median_sampling_size",
-                    default=self._config_entry.options.get(
-                        "median_sampling_size", DEFAULT_MEDIAN_SIZE
-                    ),
-                ): selector(
-                    {
-                        "number": {
-                            "min": 1,
-                            "max": 60,
-                            "unit_of_measurement": "samples",
-                            "mode": "box",
-                        }
-                    }
-                ),
+                ): str,
+                **_pipeline_fields(get_default),
                 vol.Optional(
-                    "desired_time_to_95",
-                    default=self._config_entry.options.get(
-                        "desired_time_to_95", DEFAULT_EMA_DESIRED_TIME_TO_95
-                    ),
-                ): selector(
-                    {
-                        "number": {
-                            "min": 1,
-                            "max": 600,
-                            "unit_of_measurement": "seconds",
-                            "mode": "box",
-                        }
-                    }
-                ),
+                    "shadow_pipelines",
+                    default=get_default("shadow_pipelines", DEFAULT_SHADOW_PIPELINES),
+                ): selector({"text": {}}),
+                vol.Optional("preview", default=False): selector({"boolean": {}}),
             }
         )
 
         return self.async_show_form(
             step_id="init",
             data_schema=data_schema,
+            errors=errors,
+            description_placeholders={"preview": preview_text},
+        )
+
+    async def _async_preview(self, user_input):
+        """Compare the filter response of the submitted settings with the current ones."""
+        if "recorder" not in self.hass.config.components:
+            return "The preview needs the recorder."
+
+        # The history is fetched once per flow, every preview reuses it
+        if self._history is None:
+            self._history = await preview.async_fetch_history(
+                self.hass,
+                self._config_entry.data.get("input_sensor"),
+                self._config_entry.data.get(
+                    "input_aggregation", DEFAULT_INPUT_AGGREGATION
+                ),
+            )
+        timestamps, values = self._history
+        if not values:
+            return "No history of the input sensor to preview."
+
+        def settings(get):
+            return {
+                "lowpass_time_constant": get("lowpass_time_constant", DEFAULT_LOW_PASS),
+                "median_sampling_size": get(
+                    "median_sampling_size", DEFAULT_MEDIAN_SIZE
+                ),
+                "desired_time_to_95": get(
+                    "desired_time_to_95", DEFAULT_EMA_DESIRED_TIME_TO_95
+                ),
+            }
+
+        # The metrics of the current settings are computed once per flow as well
+        if self._current_metrics is None:
+            self._current_metrics = await self.hass.async_add_executor_job(
+                preview.response_metrics,
+                timestamps,
+                values,
+                settings(
+                    lambda key, default: get_config_value(
+                        self._config_entry, key, default
+                    )
+                ),
+            )
+        proposed_metrics = await self.hass.async_add_executor_job(
+            preview.response_metrics, timestamps, values, settings(user_input.get)
+        )
+        return preview.format_metrics(
+            timestamps, self._current_metrics, proposed_metrics
         )
@@ -6,3 +6,116 @@ ICON = "mdi:flash"
 DEFAULT_LOW_PASS = 15
 DEFAULT_MEDIAN_SIZE = 15
 DEFAULT_EMA_DESIRED_TIME_TO_95 = 120
+DEFAULT_PUBLISH_INTERVAL = 0
+DEFAULT_IMPORT_STATISTICS = False
+DEFAULT_SLOPE_WINDOW = 0
+DEFAULT_SAMPLE_LOG_SIZE = 0
+DEFAULT_EMA_HORIZONS = ""
+DEFAULT_HOLT_TIME_TO_95 = 0
+DEFAULT_HOLT_TREND_TIME_TO_95 = 300
+DEFAULT_HOLT_PREDICTION_HORIZON = 0
+DEFAULT_THRESHOLD_ENABLED = False
+DEFAULT_THRESHOLD_UPPER = 0
+DEFAULT_THRESHOLD_LOWER = 0
+DEFAULT_THRESHOLD_DWELL = 0
+DEFAULT_SHADOW_PIPELINES = ""
+DEFAULT_HAMPEL_WINDOW = 15
+DEFAULT_HAMPEL_THRESHOLD = 3
+
+# Settings a shadow pipeline may override, e.g.
+# "lowpass_time_constant=30, desired_time_to_95=60; median_sampling_size=5"
+SHADOW_SETTINGS = [
+    "lowpass_time_constant",
+    "median_sampling_size",
+    "desired_time_to_95",
+]
+
+# Behavior of a pipeline while its input is unavailable
+UNAVAILABLE_BEHAVIOR_HOLD = "hold"
+UNAVAILABLE_BEHAVIOR_RESET = "reset"
+UNAVAILABLE_BEHAVIOR_DECAY = "decay"
+UNAVAILABLE_BEHAVIORS = [
+    UNAVAILABLE_BEHAVIOR_HOLD,
+    UNAVAILABLE_BEHAVIOR_RESET,
+    UNAVAILABLE_BEHAVIOR_DECAY,
+]
+DEFAULT_UNAVAILABLE_BEHAVIOR = UNAVAILABLE_BEHAVIOR_HOLD
+
+# Behavior of a pipeline whose input has not reported for the stale timeout
+STALE_BEHAVIOR_UNAVAILABLE = "unavailable"
+STALE_BEHAVIOR_DECAY = "decay"
+STALE_BEHAVIORS = [STALE_BEHAVIOR_UNAVAILABLE, STALE_BEHAVIOR_DECAY]
+DEFAULT_STALE_BEHAVIOR = STALE_BEHAVIOR_UNAVAILABLE
+DEFAULT_STALE_TIMEOUT = 0
+
+# Aggregation of several input sensors
+INPUT_AGGREGATION_OPTIONS = ["sum", "mean", "min", "max"]
+DEFAULT_INPUT_AGGREGATION = "sum"
+
+# Window of the slope output, either a number of samples or seconds
+SLOPE_WINDOW_UNIT_SAMPLES = "samples"
+SLOPE_WINDOW_UNIT_SECONDS = "seconds"
+SLOPE_WINDOW_UNITS = [SLOPE_WINDOW_UNIT_SAMPLES, SLOPE_WINDOW_UNIT_SECONDS]
+DEFAULT_SLOPE_WINDOW_UNIT = SLOPE_WINDOW_UNIT_SECONDS
+
+# Riemann integration of the EMA output, e.g. energy from power
+INTEGRATION_METHOD_NONE = "none"
+INTEGRATION_METHOD_TRAPEZOIDAL = "trapezoidal"
+INTEGRATION_METHOD_LEFT = "left"
+INTEGRATION_METHOD_RIGHT = "right"
+INTEGRATION_METHODS = [
+    INTEGRATION_METHOD_NONE,
+    INTEGRATION_METHOD_TRAPEZOIDAL,
+    INTEGRATION_METHOD_LEFT,
+    INTEGRATION_METHOD_RIGHT,
+]
+DEFAULT_INTEGRATION_METHOD = INTEGRATION_METHOD_NONE
+INTEGRATION_PUBLISH_INTERVAL = 60
+
+# FIR smoothing of the median output, with Savitzky-Golay or custom coefficients
+FIR_METHOD_NONE = "none"
+FIR_METHOD_SAVITZKY_GOLAY = "savitzky_golay"
+FIR_METHOD_CUSTOM = "custom"
+FIR_METHODS = [FIR_METHOD_NONE, FIR_METHOD_SAVITZKY_GOLAY, FIR_METHOD_CUSTOM]
+DEFAULT_FIR_METHOD = FIR_METHOD_NONE
+DEFAULT_FIR_WINDOW = 15
+DEFAULT_FIR_POLYORDER = 2
+DEFAULT_FIR_COEFFICIENTS = ""
+
+# Hampel outlier rejection of the lowpass output, before the moving median or
+# instead of it
+HAMPEL_MODE_NONE = "none"
+HAMPEL_MODE_BEFORE_MEDIAN = "before_median"
+HAMPEL_MODE_REPLACE_MEDIAN = "replace_median"
+HAMPEL_MODES = [
+    HAMPEL_MODE_NONE,
+    HAMPEL_MODE_BEFORE_MEDIAN,
+    HAMPEL_MODE_REPLACE_MEDIAN,
+]
+DEFAULT_HAMPEL_MODE = HAMPEL_MODE_NONE
+
+# Integration-wide budget for the time spent in smoothing callbacks,
+# in percent of the event loop time
+CONF_CPU_BUDGET = "cpu_budget"
+DEFAULT_CPU_BUDGET = 10
+
+# Load levels of an input degraded by the load scheduler
+LOAD_LEVEL_NORMAL = 0
+LOAD_LEVEL_DECIMATE = 1
+LOAD_LEVEL_COALESCE = 2
+LOAD_LEVEL_THROTTLE_PUBLISH = 3
+DECIMATION_FACTOR = 4
+SHED_PUBLISH_INTERVAL = 30
+
+# Integration-wide and per-entry caps on the memory held by the stage buffers, in KiB
+CONF_MEMORY_CAP = "memory_cap"
+DEFAULT_MEMORY_CAP = 65536
+DEFAULT_ENTRY_MEMORY_CAP = 0
+
+# Approximate memory of a buffered value (a float and its reference) and of a
+# buffered (time, value) tuple, in bytes
+SAMPLE_MEMORY = 32
+TIMED_SAMPLE_MEMORY = 112
+
+# Sample rate assumed when estimating the memory of time windows, per second
+ESTIMATED_SAMPLE_RATE = 1
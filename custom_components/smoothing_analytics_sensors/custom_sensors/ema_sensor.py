@@ -1,13 +1,7 @@
 import logging
-from datetime import datetime
 
-from homeassistant.helpers import entity_registry as er
-from homeassistant.helpers.event import async_track_state_change_event
-from homeassistant.helpers.restore_state import RestoreEntity
-
-from ..const import DEFAULT_EMA_DESIRED_TIME_TO_95, DOMAIN, ICON
-from ..entity import SmoothingAnalyticsEntity
-from ..utils.misc import async_resolve_entity_id_from_unique_id, get_config_value
+from ..entity import SmoothingAnalyticsStageSensor
+from ..pipeline import PipelineStage
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -18,8 +12,9 @@ def calculate_alpha(desired_time_to_95, update_interval):
     # Calculate the number of updates in the smoothing window
     number_of_updates_needed = desired_time_to_95 / update_interval
 
-    # Calculate alpha based on the number of updates needed
-    return 2 / (number_of_updates_needed + 1)
+    # Calculate alpha based on the number of updates needed, an update gap longer
+    # than the smoothing window must not overshoot the input
+    return min(1.0, 2 / (number_of_updates_needed + 1))
 
 
 def ema_filter(value, previous_value, alpha):
@@ -27,228 +22,129 @@ def ema_filter(value, previous_value, alpha):
     return alpha * value + (1 - alpha) * previous_value
 
 
-class EmaSensor(SmoothingAnalyticsEntity, RestoreEntity):
-    """Exponential Moving Average (EMA) filtered sensor with persistent state and device support, based on unique_id."""
-
-    # Define the attributes of the entity
-    _attr_icon = ICON
-    _attr_has_entity_name = True
-
-    def __init__(self, input_unique_id, desired_time_to_95, sensor_hash, config_entry):
-        super().__init__(config_entry)
-        self._input_unique_id = input_unique_id
-        self._desired_time_to_95 = desired_time_to_95
-        self._sensor_hash = sensor_hash
-        self._state = None
-        self._previous_value = None
-        self._last_updated = None
-        self._input_entity_id = None
-        self._unit_of_measurement = None
-        self._device_class = None
-        self._state_class = None
-        self._last_reset = None
-        self._config_entry = config_entry
-        self._unique_id = f"sas_ema_{sensor_hash}"
-        self._update_interval = 1
-        self._update_settings()
-
-    def _update_settings(self):
-        """Fetch updated settings from config_entry."""
-        self._desired_time_to_95 = get_config_value(
-            self._config_entry, "desired_time_to_95", DEFAULT_EMA_DESIRED_TIME_TO_95
-        )
-
-        # Recalculate alpha based on the new settings
-        if self._update_interval is not None:
-            self._alpha = calculate_alpha(
-                self._desired_time_to_95, self._update_interval
-            )
-
-        # Log updated settings
-        _LOGGER.debug(
-            f"Updated EMA settings: desired_time_to_95={self._desired_time_to_95}, _update_interval={self._update_interval}, alpha={self._alpha}"
-        )
-
-    @property
-    def name(self):
-        return f"EMA Filtered Sensor {self._sensor_hash}"
+class EmaStage(PipelineStage):
+    """Exponential Moving Average (EMA) stage applied to the median-filtered data.
 
-    @property
-    def unique_id(self):
-        return self._unique_id
+    Additional horizons are computed in the same update as a small vector of
+    alphas and values. The first horizon is the primary output of the stage.
+    """
 
-    @property
-    def state(self):
-        return self._state
-
-    @property
-    def unit_of_measurement(self):
-        return self._unit_of_measurement
-
-    @property
-    def device_class(self):
-        return self._device_class
-
-    @property
-    def state_class(self):
-        return self._state_class
+    stage_type = "ema"
 
-    @property
-    def last_reset(self):
-        return self._last_reset
+    def __init__(self, key, upstream, desired_time_to_95, horizons=()):
+        super().__init__(key, upstream)
+        self.desired_time_to_95 = desired_time_to_95
+        self.horizons = (desired_time_to_95, *horizons)
+        self.alphas = [
+            calculate_alpha(horizon, self.update_interval) for horizon in self.horizons
+        ]
+        self.values = [None] * len(self.horizons)
+        self.previous_value = None
 
     @property
-    def extra_state_attributes(self):
-        """Return the state attributes."""
-
-        return {
-            "alpha": self._alpha,
-            "desired_time_to_95": self._desired_time_to_95,
-            "input_entity_id": self._input_entity_id,
-            "input_unique_id": self._input_unique_id,
-            "last_updated": self._last_updated,
-            "number_of_updates_needed": self._desired_time_to_95
-            / self._update_interval,
-            "previous_value": self._previous_value,
-            "sensor_hash": self._sensor_hash,
-            "sensor_update_interval": self._update_interval,
-            "type": "ema",
-            "unique_id": self._unique_id,
-        }
-
-    async def async_update(self):
-        """Manually trigger the sensor update."""
-        await self._handle_update(event=None)
-
-    async def _handle_update(self, event):
-        """Handle the sensor state update (for both manual and state change)."""
+    def alpha(self):
+        """Return the alpha of the primary horizon."""
+        return self.alphas[0]
+
+    def update(self, value):
+        """Apply the EMA filters with alphas recalculated for the last update interval."""
+        self.previous_value = self.value
+
+        for index, horizon in enumerate(self.horizons):
+            alpha = calculate_alpha(horizon, self.update_interval)
+            previous_value = self.values[index]
+            self.alphas[index] = alpha
+            self.values[index] = (
+                value
+                if previous_value is None
+                else ema_filter(value, previous_value, alpha)
+            )
 
-        # Get the current time
-        now = datetime.now()
+        self.value = self.values[0]
+        return self.value
 
-        # Calculate the update interval to be used
-        if self._last_updated is not None:
-            self._update_interval = (
-                now - datetime.fromisoformat(self._last_updated)
-            ).total_seconds()
+    def reset(self):
+        """Forget the EMA state."""
+        super().reset()
+        self.values = [None] * len(self.horizons)
+        self.previous_value = None
 
-        # Ensure settings are reloaded if config is changed.
-        self._update_settings()
+    def restore(self, value, attributes):
+        """Restore the EMA values, or only the primary one from a sensor state."""
+        values = attributes.get("values")
+        if values is not None and len(values) == len(self.horizons):
+            self.values = list(values)
+        else:
+            self.values[0] = value
 
-        # Check if the input_entity_id has been resolved from unique_id
-        if not self._input_entity_id:
-            await self._resolve_input_entity_id()
+        self.value = self.values[0]
+        self.previous_value = self.value
 
-        # Continue if input_entity_id is available
-        if not self._input_entity_id:
-            _LOGGER.warning(f"Entity with unique_id {self._input_unique_id} not found.")
-            return
+    def restore_horizon(self, index, value):
+        """Restore the EMA value of an additional horizon from a sensor state."""
+        self.values[index] = value
 
-        # Fetch the current value from the input sensor
-        input_state = self.hass.states.get(self._input_entity_id)
-        if input_state is None or input_state.state is None:
-            _LOGGER.warning(
-                f"Sensor {self._input_entity_id} not ready or not found. Skipping EMA sensor update."
-            )
-            return
-        try:
-            input_value = float(input_state.state)
-        except ValueError:
-            _LOGGER.warning(
-                f"Invalid value from {self._input_entity_id}: {input_state.state}"
-            )
-            return
+    def as_dict(self):
+        """Return the EMA values of every horizon to be stored."""
+        return {**super().as_dict(), "values": self.values}
 
-        # Fetch unit_of_measurement and device_class from the input sensor
-        self._unit_of_measurement = input_state.attributes.get("unit_of_measurement")
-        self._device_class = input_state.attributes.get("device_class")
-        self._state_class = input_state.attributes.get("state_class")
 
-        # Update the previous EMA value to the new EMA value
-        self._previous_value = self._state
-
-        # Apply EMA filter using pre-calculated alpha
-        if self._previous_value is not None:
-            self._state = round(
-                ema_filter(input_value, self._previous_value, self._alpha), 2
-            )
-        else:
-            self._state = input_value
+class EmaSensor(SmoothingAnalyticsStageSensor):
+    """Exponential Moving Average (EMA) filtered sensor with persistent state and device support."""
 
-        # Update count and last update time
-        self._last_updated = now.isoformat()
+    _stage_name = "ema"
 
-        # Trigger an update in Home Assistant
-        self.async_write_ha_state()
-
-    async def _resolve_input_entity_id(self):
-        """Resolve the entity_id from the unique_id using entity_registry."""
-
-        # Resolve the entity_id from the unique_id
-        registry = er.async_get(self.hass)
+    @property
+    def name(self):
+        return f"EMA Filtered Sensor {self._sensor_hash}"
 
-        # Resolve the entity_id from the unique_id
-        entry = registry.async_get_entity_id("sensor", DOMAIN, self._input_unique_id)
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
 
-        # Store the resolved entity_id
-        if entry:
-            self._input_entity_id = entry
+        return {
+            **super().extra_state_attributes,
+            "alpha": self._stage.alpha,
+            "desired_time_to_95": self._stage.desired_time_to_95,
+            "input_unique_id": self.upstream_unique_id,
+            "number_of_updates_needed": self._stage.desired_time_to_95
+            / self._stage.update_interval,
+            "previous_value": self._stage.previous_value,
+        }
 
-            _LOGGER.debug(
-                f"Resolved entity_id for unique_id {self._input_unique_id}: {self._input_entity_id}"
-            )
-        else:
-            _LOGGER.warning(
-                f"Entity with unique_id {self._input_unique_id} not found in registry."
-            )
 
-    async def async_added_to_hass(self):
-        """Handle the sensor being added to Home Assistant."""
+class EmaHorizonSensor(SmoothingAnalyticsStageSensor):
+    """Sensor publishing an additional horizon of the EMA stage."""
 
-        # Restore the previous state from persistent storage
-        old_state = await self.async_get_last_state()
+    def __init__(self, pipeline, stage, index):
+        self._index = index
+        self._stage_name = f"ema_{stage.horizons[index]:g}".replace(".", "_")
+        super().__init__(pipeline, stage)
 
-        if old_state is not None:
-            _LOGGER.info(f"Restoring state for {self._unique_id}")
+    @property
+    def name(self):
+        return f"EMA {self._horizon:g}s Filtered Sensor {self._sensor_hash}"
 
-            try:
-                self._state = round(float(old_state.state), 2)
-                self._previous_value = float(self._state)
-            except (ValueError, TypeError):
-                _LOGGER.warning(
-                    f"Could not restore state for {self._unique_id}, invalid value: {old_state.state}"
-                )
-                self._state = None
-                self._previous_value = None
+    @property
+    def _horizon(self):
+        return self._stage.horizons[self._index]
 
-            self._last_updated = old_state.attributes.get("last_updated", None)
-            self._update_interval = old_state.attributes.get("update_interval", 1)
-        else:
-            _LOGGER.info(
-                f"No previous state found for {self._unique_id}, starting fresh."
-            )
+    @property
+    def stage_value(self):
+        return self._stage.values[self._index]
 
-        # Check if the input_entity_id has been resolved from unique_id
-        if not self._input_entity_id:
-            _LOGGER.debug(f"Resolving entity_id for unique_id {self._input_unique_id}")
-            await self._resolve_input_entity_id()
+    def restore_stage(self, value, attributes):
+        """Restore the value of this horizon only."""
+        self._stage.restore_horizon(self._index, value)
 
-        # Continue if input_entity_id is available
-        if not self._input_entity_id:
-            _LOGGER.warning(
-                f"Entity with unique_id {self._input_unique_id} not found. Unable to track state changes."
-            )
-            return
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
 
-        # Start listening for state changes of the input sensor
-        if self._input_entity_id:
-            _LOGGER.info(
-                f"Starting to track state changes for entity_id {self._input_entity_id}"
-            )
-            async_track_state_change_event(
-                self.hass, [self._input_entity_id], self._handle_update
-            )
-        else:
-            _LOGGER.error(
-                f"Failed to track state changes, input_entity_id is not resolved."
-            )
+        return {
+            **super().extra_state_attributes,
+            "alpha": self._stage.alphas[self._index],
+            "desired_time_to_95": self._horizon,
+            "input_unique_id": self.upstream_unique_id,
+            "number_of_updates_needed": self._horizon / self._stage.update_interval,
+        }
@@ -0,0 +1,193 @@
+import logging
+import operator
+from collections import deque
+
+from ..const import (
+    DEFAULT_FIR_COEFFICIENTS,
+    DEFAULT_FIR_METHOD,
+    DEFAULT_FIR_POLYORDER,
+    DEFAULT_FIR_WINDOW,
+    FIR_METHOD_CUSTOM,
+    SAMPLE_MEMORY,
+)
+from ..entity import SmoothingAnalyticsStageSensor
+from ..pipeline import PipelineStage
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def savitzky_golay_coefficients(window, polyorder):
+    """Return the FIR coefficients, oldest sample first, of a causal Savitzky-Golay filter.
+
+    A polynomial of the given order is fitted by least squares through the
+    window, and evaluated at the newest sample. The coefficients of that
+    evaluation are the first row of the pseudo-inverse of the design matrix,
+    found by solving the normal equations for the unit vector.
+    """
+    if polyorder >= window:
+        raise ValueError(
+            f"Polynomial order {polyorder} must be below the window of {window}"
+        )
+
+    # Positions of the samples, scaled to [-1, 0] to keep the normal equations
+    # well conditioned, the newest sample is at 0
+    scale = max(window - 1, 1)
+    positions = [(index - (window - 1)) / scale for index in range(window)]
+    size = polyorder + 1
+
+    # Normal equations (A^T A) z = e0, augmented with the unit vector
+    matrix = [
+        [sum(x ** (row + column) for x in positions) for column in range(size)]
+        + [1.0 if row == 0 else 0.0]
+        for row in range(size)
+    ]
+
+    # Gauss-Jordan elimination with partial pivoting
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(matrix[row][column]))
+        matrix[column], matrix[pivot] = matrix[pivot], matrix[column]
+        pivot_value = matrix[column][column]
+        matrix[column] = [value / pivot_value for value in matrix[column]]
+        for row in range(size):
+            if row != column and matrix[row][column]:
+                factor = matrix[row][column]
+                matrix[row] = [
+                    value - factor * pivot_row_value
+                    for value, pivot_row_value in zip(matrix[row], matrix[column])
+                ]
+    solution = [matrix[row][size] for row in range(size)]
+
+    return tuple(
+        sum(solution[power] * x**power for power in range(size)) for x in positions
+    )
+
+
+def parse_coefficients(value):
+    """Parse a comma-separated list of FIR coefficients, oldest sample first."""
+    coefficients = tuple(float(part) for part in str(value).split(",") if part.strip())
+    if not coefficients:
+        raise ValueError(f"No FIR coefficients: {value}")
+    return coefficients
+
+
+def fir_coefficients(get_value):
+    """Return the FIR coefficients configured by the settings.
+
+    get_value(key, default) returns a setting, raises ValueError on invalid ones.
+    """
+    if get_value("fir_method", DEFAULT_FIR_METHOD) == FIR_METHOD_CUSTOM:
+        return parse_coefficients(
+            get_value("fir_coefficients", DEFAULT_FIR_COEFFICIENTS)
+        )
+    return savitzky_golay_coefficients(
+        int(get_value("fir_window", DEFAULT_FIR_WINDOW)),
+        int(get_value("fir_polyorder", DEFAULT_FIR_POLYORDER)),
+    )
+
+
+class FirStage(PipelineStage):
+    """Finite impulse response (FIR) stage applied to the median-filtered data.
+
+    The coefficients are computed once per configuration, e.g. by
+    savitzky_golay_coefficients, and applied to a ring buffer of the latest
+    samples. With NumPy the buffer is written twice, so the window is always a
+    contiguous slice for a vectorized dot product.
+    """
+
+    stage_type = "fir"
+
+    def __init__(self, key, upstream, coefficients):
+        super().__init__(key, upstream)
+        self.coefficients = coefficients
+        self.window = len(coefficients)
+        self.count = 0
+        if np is not None:
+            self._coefficients = np.asarray(coefficients, dtype=float)
+            self._buffer = np.zeros(2 * self.window)
+            self._position = 0
+        else:
+            self._buffer = deque(maxlen=self.window)
+
+    @property
+    def data_points(self):
+        """Return the window, oldest sample first."""
+        count = min(self.count, self.window)
+        if np is not None:
+            end = self._position + self.window
+            return self._buffer[end - count : end].tolist()
+        return list(self._buffer)
+
+    def update(self, value):
+        """Add the value to the ring buffer and apply the filter once it is full."""
+        self.count += 1
+
+        if np is not None:
+            self._buffer[self._position] = value
+            self._buffer[self._position + self.window] = value
+            self._position = (self._position + 1) % self.window
+            if self.count >= self.window:
+                window = self._buffer[self._position : self._position + self.window]
+                self.value = float(np.dot(self._coefficients, window))
+        else:
+            self._buffer.append(value)
+            if self.count >= self.window:
+                self.value = sum(map(operator.mul, self.coefficients, self._buffer))
+
+        return self.value
+
+    def reset(self):
+        """Forget the window."""
+        super().reset()
+        self.count = 0
+        if np is not None:
+            self._buffer[:] = 0.0
+            self._position = 0
+        else:
+            self._buffer.clear()
+
+    def restore(self, value, attributes):
+        """Restore the filter value and its window."""
+        self.value = value
+        for data_point in (attributes.get("data_points") or [])[-self.window :]:
+            self.update(data_point)
+        self.value = value
+
+    def as_dict(self):
+        """Return the filter value and its window."""
+        return {**super().as_dict(), "data_points": self.data_points}
+
+    @classmethod
+    def estimate_memory(cls, coefficients):
+        """Return the memory of the coefficients and a full window in bytes."""
+        return 2 * len(coefficients) * SAMPLE_MEMORY
+
+    def memory_usage(self):
+        """Return the memory of the coefficients and the window in bytes."""
+        return self.estimate_memory(self.coefficients)
+
+
+class FirSensor(SmoothingAnalyticsStageSensor):
+    """Savitzky-Golay or custom FIR filtered sensor with persistent state and device support."""
+
+    _stage_name = "fir"
+
+    @property
+    def name(self):
+        return f"FIR Filtered Sensor {self._sensor_hash}"
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+
+        return {
+            **super().extra_state_attributes,
+            "data_points": self._stage.data_points,
+            "fir_window": self._stage.window,
+            "input_unique_id": self.upstream_unique_id,
+            "missing_data_points": max(0, self._stage.window - self._stage.count),
+        }
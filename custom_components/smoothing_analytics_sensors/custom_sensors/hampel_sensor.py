@@ -0,0 +1,130 @@
+import logging
+import math
+from collections import deque
+
+from ..const import SAMPLE_MEMORY
+from ..entity import SmoothingAnalyticsStageSensor
+from ..pipeline import PipelineStage
+from ..utils.order_statistics import SortedWindow, median_absolute_deviation
+
+_LOGGER = logging.getLogger(__name__)
+
+# Scale of the median absolute deviation to the standard deviation of
+# normally distributed samples
+MAD_SCALE = 1.4826
+
+
+class HampelStage(PipelineStage):
+    """Hampel identifier replacing outliers of the lowpass-filtered data.
+
+    A sample deviating from the median of the previous window by more than
+    threshold times the scaled median absolute deviation (MAD) is replaced by
+    that median. The window is also kept in sorted order, so the median is
+    looked up and the MAD selected in O(log n) per sample instead of sorting
+    the window and its deviations. The window holds the raw samples, so a
+    lasting level change is accepted once it fills half of it. Samples pass
+    unchanged until the window is full, and while its MAD is zero, as a window
+    of mostly equal samples leaves no spread to judge an outlier by.
+    """
+
+    stage_type = "hampel"
+
+    def __init__(self, key, upstream, window, threshold):
+        super().__init__(key, upstream)
+        self.window = window
+        self.threshold = threshold
+        self.data_points = deque()
+        self.median = None
+        self.deviation = None
+        self.samples = 0
+        self.rejected = 0
+        self._ordered = SortedWindow()
+
+    def update(self, value):
+        """Replace the value by the median of the window if it is an outlier."""
+        self.samples += 1
+
+        # Non-finite samples are always outliers, and would break the sort order
+        if not math.isfinite(value):
+            self.rejected += 1
+            return self.value
+
+        self.value = value
+
+        if len(self.data_points) >= self.window:
+            self.median, self.deviation = median_absolute_deviation(self._ordered)
+            limit = self.threshold * MAD_SCALE * self.deviation
+
+            # A zero MAD has no spread to judge by, and would reject every change
+            if limit and abs(value - self.median) > limit:
+                self.value = self.median
+                self.rejected += 1
+            self._ordered.remove(self.data_points.popleft())
+
+        self.data_points.append(value)
+        self._ordered.insert(value)
+        return self.value
+
+    def reset(self):
+        """Forget the window, keeping the sample counts."""
+        super().reset()
+        self.data_points.clear()
+        self._ordered.clear()
+        self.median = None
+        self.deviation = None
+
+    def restore(self, value, attributes):
+        """Restore the output, its window and the sample counts."""
+        self.value = value
+        for data_point in (attributes.get("data_points") or [])[-self.window :]:
+            self.data_points.append(data_point)
+            self._ordered.insert(data_point)
+        self.samples = int(attributes.get("samples") or 0)
+        self.rejected = int(attributes.get("rejected") or 0)
+
+    def as_dict(self):
+        """Return the output, its window and the sample counts."""
+        return {
+            **super().as_dict(),
+            "data_points": list(self.data_points),
+            "samples": self.samples,
+            "rejected": self.rejected,
+        }
+
+    @classmethod
+    def estimate_memory(cls, window, threshold):
+        """Return the memory of a full window and its sorted copy in bytes."""
+        return 2 * window * SAMPLE_MEMORY
+
+    def memory_usage(self):
+        """Return the memory of the window and its sorted copy in bytes."""
+        return 2 * len(self.data_points) * SAMPLE_MEMORY
+
+
+class HampelSensor(SmoothingAnalyticsStageSensor):
+    """Hampel filtered sensor with persistent state and device support."""
+
+    _stage_name = "hampel"
+
+    @property
+    def name(self):
+        return f"Hampel Filtered Sensor {self._sensor_hash}"
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+
+        return {
+            **super().extra_state_attributes,
+            "data_points": list(self._stage.data_points),
+            "hampel_threshold": self._stage.threshold,
+            "hampel_window": self._stage.window,
+            "input_unique_id": self.upstream_unique_id,
+            "median": self._stage.median,
+            "median_absolute_deviation": self._stage.deviation,
+            "missing_data_points": max(
+                0, self._stage.window - len(self._stage.data_points)
+            ),
+            "rejected": self._stage.rejected,
+            "samples": self._stage.samples,
+        }
@@ -0,0 +1,121 @@
+import logging
+
+from ..entity import SmoothingAnalyticsStageSensor
+from ..pipeline import PipelineStage
+from .ema_sensor import calculate_alpha
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def holt_filter(value, level, trend, alpha, beta, interval):
+    """Apply Holt's double exponential smoothing with the trend in units per second."""
+    new_level = alpha * value + (1 - alpha) * (level + trend * interval)
+    new_trend = beta * (new_level - level) / interval + (1 - beta) * trend
+    return new_level, new_trend
+
+
+class HoltStage(PipelineStage):
+    """Holt (level and trend) stage applied to the median-filtered data.
+
+    The level follows the input like an EMA but without the lag on sustained
+    ramps, and the trend extrapolates it prediction_horizon seconds ahead.
+    """
+
+    stage_type = "holt"
+
+    def __init__(
+        self, key, upstream, desired_time_to_95, trend_time_to_95, prediction_horizon
+    ):
+        super().__init__(key, upstream)
+        self.desired_time_to_95 = desired_time_to_95
+        self.trend_time_to_95 = trend_time_to_95
+        self.prediction_horizon = prediction_horizon
+        self.alpha = calculate_alpha(desired_time_to_95, self.update_interval)
+        self.beta = calculate_alpha(trend_time_to_95, self.update_interval)
+        self.trend = 0.0
+
+    @property
+    def prediction(self):
+        """Return the level extrapolated prediction_horizon seconds ahead."""
+        if self.value is None:
+            return None
+        return self.value + self.trend * self.prediction_horizon
+
+    def update(self, value):
+        """Update the level and trend with alphas recalculated for the last update interval."""
+        if self.value is None:
+            self.value = value
+            self.trend = 0.0
+            return self.value
+
+        self.alpha = calculate_alpha(self.desired_time_to_95, self.update_interval)
+        self.beta = calculate_alpha(self.trend_time_to_95, self.update_interval)
+        self.value, self.trend = holt_filter(
+            value, self.value, self.trend, self.alpha, self.beta, self.update_interval
+        )
+        return self.value
+
+    def reset(self):
+        """Forget the level and trend."""
+        super().reset()
+        self.trend = 0.0
+
+    def restore(self, value, attributes):
+        """Restore the level and trend."""
+        self.value = value
+        self.trend = float(attributes.get("trend") or 0.0)
+
+    def as_dict(self):
+        """Return the level and trend to be stored."""
+        return {**super().as_dict(), "trend": self.trend}
+
+
+class HoltSensor(SmoothingAnalyticsStageSensor):
+    """Holt level filtered sensor with persistent state and device support."""
+
+    _stage_name = "holt"
+
+    @property
+    def name(self):
+        return f"Holt Filtered Sensor {self._sensor_hash}"
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+
+        return {
+            **super().extra_state_attributes,
+            "alpha": self._stage.alpha,
+            "beta": self._stage.beta,
+            "desired_time_to_95": self._stage.desired_time_to_95,
+            "input_unique_id": self.upstream_unique_id,
+            "trend": self._stage.trend,
+            "trend_time_to_95": self._stage.trend_time_to_95,
+        }
+
+
+class HoltPredictionSensor(SmoothingAnalyticsStageSensor):
+    """Holt level extrapolated along the trend to compensate for the pipeline lag."""
+
+    _stage_name = "holt_prediction"
+
+    @property
+    def name(self):
+        return f"Holt Prediction Sensor {self._sensor_hash}"
+
+    @property
+    def stage_value(self):
+        return self._stage.prediction
+
+    def restore_stage(self, value, attributes):
+        """Skip restoring, the prediction is derived from the restored level and trend."""
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+
+        return {
+            **super().extra_state_attributes,
+            "input_unique_id": f"sas_holt_{self.config_entry.entry_id}",
+            "prediction_horizon": self._stage.prediction_horizon,
+        }
@@ -0,0 +1,155 @@
+import logging
+
+from homeassistant.components.sensor import SensorStateClass
+from homeassistant.util import dt as dt_util
+
+from ..const import (
+    INTEGRATION_METHOD_LEFT,
+    INTEGRATION_METHOD_RIGHT,
+    INTEGRATION_PUBLISH_INTERVAL,
+)
+from ..entity import SmoothingAnalyticsStageSensor
+from ..pipeline import PipelineStage
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def riemann_area(method, previous_value, value, interval):
+    """Return the area under the signal between two samples, in units times hours."""
+    if method == INTEGRATION_METHOD_LEFT:
+        height = previous_value
+    elif method == INTEGRATION_METHOD_RIGHT:
+        height = value
+    else:
+        height = (previous_value + value) / 2
+
+    return height * interval / 3600
+
+
+class IntegrationStage(PipelineStage):
+    """Riemann sum of the unrounded EMA output, e.g. energy from smoothed power.
+
+    Only positive areas are accumulated, so the total never decreases. Samples
+    up to the last integrated one are skipped, so replaying a sample log after
+    a restart does not count them twice.
+    """
+
+    stage_type = "integration"
+
+    def __init__(self, key, upstream, method):
+        super().__init__(key, upstream)
+        self.method = method
+        self.integrated_until = None
+        self._previous_value = None
+
+    def update(self, value):
+        """Add the area since the previous sample to the total."""
+        timestamp = self.last_updated
+        if self.integrated_until is not None and timestamp <= self.integrated_until:
+            return self.value
+
+        if self._previous_value is not None:
+            interval = (timestamp - self.integrated_until).total_seconds()
+            area = riemann_area(self.method, self._previous_value, value, interval)
+            self.value = (self.value or 0.0) + max(area, 0.0)
+        elif self.value is None:
+            self.value = 0.0
+
+        self.integrated_until = timestamp
+        self._previous_value = value
+        return self.value
+
+    def reset(self):
+        """Start a new segment after a gap, keeping the total."""
+        self._previous_value = None
+
+    def restore(self, value, attributes):
+        """Restore the total and the time it was integrated up to.
+
+        A new segment starts with the next sample, so the time the total was
+        not tracked, e.g. while Home Assistant was down, adds no area.
+        """
+        self.value = value
+        self._previous_value = None
+        integrated_until = attributes.get("integrated_until")
+        if integrated_until:
+            self.integrated_until = dt_util.parse_datetime(integrated_until)
+
+    def as_dict(self):
+        """Return the total to be stored."""
+        return {
+            **super().as_dict(),
+            "integrated_until": (
+                self.integrated_until.isoformat() if self.integrated_until else None
+            ),
+        }
+
+
+class IntegrationSensor(SmoothingAnalyticsStageSensor):
+    """Total of the EMA filtered sensor over time, e.g. energy from power."""
+
+    _stage_name = "integration"
+
+    # The total changes on every sample, but is only needed at a low rate
+    _min_publish_interval = INTEGRATION_PUBLISH_INTERVAL
+
+    # The recorder compiles statistics of totals itself
+    _import_statistics = False
+
+    # A total that only grows, as the energy dashboard expects
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    @property
+    def name(self):
+        return f"Integration Sensor {self._sensor_hash}"
+
+    async def async_added_to_hass(self):
+        """Handle the sensor being added, keeping the larger of the restored totals."""
+        await super().async_added_to_hass()
+
+        # The pipeline store is only saved periodically, so the previous state
+        # may hold a more recent total
+        old_state = await self.async_get_last_state()
+        if old_state is None:
+            return
+
+        try:
+            value = float(old_state.state)
+        except (ValueError, TypeError):
+            return
+
+        if self._stage.value is None or value > self._stage.value:
+            _LOGGER.debug(f"Restoring the newer total for {self._unique_id}")
+            self.restore_stage(value, old_state.attributes)
+
+    @property
+    def native_value(self):
+        if self._stage.value is None:
+            return None
+        return round(self._stage.value, 3)
+
+    @property
+    def native_unit_of_measurement(self):
+        unit = self._stage.metadata.get("unit_of_measurement")
+        return f"{unit}h" if unit else None
+
+    @property
+    def device_class(self):
+        if self._stage.metadata.get("device_class") == "power":
+            return "energy"
+        return None
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+
+        return {
+            **super().extra_state_attributes,
+            "input_unique_id": f"sas_ema_{self.config_entry.entry_id}",
+            "integration_method": self._stage.method,
+            "integrated_until": (
+                self._stage.integrated_until.isoformat()
+                if self._stage.integrated_until
+                else None
+            ),
+        }
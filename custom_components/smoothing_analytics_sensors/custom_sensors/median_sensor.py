@@ -1,245 +1,145 @@
 import logging
 import statistics
-from datetime import datetime
+from collections import deque
 
-from homeassistant.helpers import entity_registry
-from homeassistant.helpers.event import async_track_state_change_event
-from homeassistant.helpers.restore_state import RestoreEntity
-
-from ..const import DEFAULT_MEDIAN_SIZE, DOMAIN, ICON
-from ..entity import SmoothingAnalyticsEntity
-from ..utils.misc import async_resolve_entity_id_from_unique_id, get_config_value
+from ..const import SAMPLE_MEMORY
+from ..entity import SmoothingAnalyticsStageSensor
+from ..pipeline import PipelineStage
 
 _LOGGER = logging.getLogger(__name__)
 
+# Deviations are clipped at this multiple of the mean absolute deviation, and
+# the estimate moves by at most this multiple of it divided by the window size
+SKETCH_DEVIATION_CLIP = 3
+SKETCH_STEP_GAIN = 4
 
-class MedianSensor(SmoothingAnalyticsEntity, RestoreEntity):
-    """Median filtered sensor with persistent state and device support, based on unique_id."""
-
-    # Define the attributes of the entity
-    _attr_icon = ICON
-    _attr_has_entity_name = True
-
-    def __init__(self, input_unique_id, sampling_size, sensor_hash, config_entry):
-        super().__init__(config_entry)
-        self._input_unique_id = input_unique_id
-        self._sensor_hash = sensor_hash
-        self._state = None
-        self._data_points = []
-        self._last_updated = None
-        self._input_entity_id = None
-        self._unit_of_measurement = None
-        self._device_class = None
-        self._state_class = None
-        self._last_reset = None
-        self._config_entry = config_entry
-        self._unique_id = f"sas_median_{sensor_hash}"
-        self._sampling_size = sampling_size
-        self._update_interval = 1
-        self._update_settings()
-
-    def _update_settings(self):
-        """Fetch updated settings from config_entry options."""
-        self._sampling_size = get_config_value(
-            self._config_entry, "median_sampling_size", DEFAULT_MEDIAN_SIZE
-        )
-
-        # Log updated settings
-        _LOGGER.debug(f"Updated Median settings: sampling_size={self._sampling_size}")
 
-    @property
-    def name(self):
-        return f"Median Filtered Sensor {self._sensor_hash}"
+class MedianStage(PipelineStage):
+    """Moving median stage applied to the lowpass-filtered data."""
 
-    @property
-    def unique_id(self):
-        return self._unique_id
+    stage_type = "median"
 
-    @property
-    def state(self):
-        return self._state
+    def __init__(self, key, upstream, sampling_size):
+        super().__init__(key, upstream)
+        self.sampling_size = sampling_size
+        self.data_points = deque(maxlen=sampling_size)
 
-    @property
-    def unit_of_measurement(self):
-        return self._unit_of_measurement
+    def update(self, value):
+        """Append the value to the window and calculate the median once it is full."""
+        self.data_points.append(value)
 
-    @property
-    def device_class(self):
-        return self._device_class
+        if len(self.data_points) >= self.sampling_size:
+            self.value = statistics.median(self.data_points)
 
-    @property
-    def state_class(self):
-        return self._state_class
+        return self.value
 
-    @property
-    def last_reset(self):
-        return self._last_reset
+    def reset(self):
+        """Forget the median state."""
+        super().reset()
+        self.data_points.clear()
 
-    @property
-    def extra_state_attributes(self):
-        """Return the state attributes."""
+    def restore(self, value, attributes):
+        """Restore the median value and its window."""
+        self.value = value
+        self.data_points.extend(attributes.get("data_points") or [])
 
-        # Calculate the number of data points
-        data_points_count = len(self._data_points)
+    def as_dict(self):
+        """Return the median value and its window."""
+        return {"value": self.value, "data_points": list(self.data_points)}
 
-        # Calculate the number of missing data points
-        missing_data_points = max(0, self._sampling_size - data_points_count)
+    @classmethod
+    def estimate_memory(cls, sampling_size):
+        """Return the memory of a full window in bytes."""
+        return sampling_size * SAMPLE_MEMORY
 
-        return {
-            "data_points": self._data_points,
-            "data_points_count": data_points_count,
-            "input_entity_id": self._input_entity_id,
-            "input_unique_id": self._input_unique_id,
-            "last_updated": self._last_updated,
-            "median_sampling_size": self._sampling_size,
-            "missing_data_points": missing_data_points,
-            "sensor_hash": self._sensor_hash,
-            "sensor_update_interval": self._update_interval,
-            "type": "moving_median",
-            "unique_id": self._unique_id,
-        }
+    def memory_usage(self):
+        """Return the memory of the window in bytes."""
+        return len(self.data_points) * SAMPLE_MEMORY
+
+
+class MedianSketchStage(PipelineStage):
+    """Streaming approximation of the moving median in constant memory.
 
-    async def async_update(self):
-        """Manually trigger the sensor update."""
-        await self._handle_update(event=None)
-
-    async def _handle_update(self, event):
-        """Handle the sensor state update (for both manual and state change)."""
-
-        # Get the current time
-        now = datetime.now()
-
-        # Calculate the update interval to be used
-        if self._last_updated is not None:
-            self._update_interval = (
-                now - datetime.fromisoformat(self._last_updated)
-            ).total_seconds()
-
-        # Ensure settings are reloaded if config is changed.
-        self._update_settings()
-
-        # Check if the input_entity_id has been resolved from unique_id
-        if not self._input_entity_id:
-            await self._resolve_input_entity_id()
-
-        # Continue if input_entity_id is available
-        if not self._input_entity_id:
-            _LOGGER.warning(f"Entity with unique_id {self._input_unique_id} not found.")
-            return
-
-        # Fetch the current value from the input sensor
-        input_state = self.hass.states.get(self._input_entity_id)
-        if input_state is None or input_state.state is None:
-            _LOGGER.warning(
-                f"Sensor {self._input_entity_id} not ready or not found. Skipping median sensor update."
-            )
-            return
-        try:
-            input_value = float(input_state.state)
-        except ValueError:
-            _LOGGER.warning(
-                f"Invalid value from {self._input_entity_id}: {input_state.state}"
-            )
-            return
-
-        # Fetch unit_of_measurement and device_class from the input sensor
-        self._unit_of_measurement = input_state.attributes.get("unit_of_measurement")
-        self._device_class = input_state.attributes.get("device_class")
-        self._state_class = input_state.attributes.get("state_class")
-
-        # Append the current value to the list of data points
-        if len(self._data_points) > 0:
-            new_data_points = self._data_points.copy()
+    Used instead of the median stage when its window would exceed a memory cap.
+    The estimate moves towards every sample by at most a step proportional to
+    the mean absolute deviation, so a single spike barely moves it while level
+    changes are followed within a few windows. Deviations are clipped when
+    tracked, so spikes do not inflate the step either.
+    """
+
+    stage_type = "median_sketch"
+
+    def __init__(self, key, upstream, sampling_size):
+        super().__init__(key, upstream)
+        self.sampling_size = sampling_size
+        self.deviation = 0.0
+
+    def update(self, value):
+        """Move the estimate towards the value by at most one step."""
+        if self.value is None:
+            self.value = value
+            return self.value
+
+        error = value - self.value
+        if self.deviation:
+            error_size = min(abs(error), SKETCH_DEVIATION_CLIP * self.deviation)
         else:
-            new_data_points = []
+            error_size = abs(error)
+        self.deviation += (error_size - self.deviation) / self.sampling_size
 
-        new_data_points.append(input_value)
+        step = SKETCH_STEP_GAIN * self.deviation / self.sampling_size
+        self.value += max(-step, min(step, error))
+        return self.value
 
-        # Calculate the median if we have enough data points
-        if len(new_data_points) >= self._sampling_size:
-            self._state = round(statistics.median(new_data_points), 2)
+    def reset(self):
+        """Forget the estimate."""
+        super().reset()
+        self.deviation = 0.0
 
-        # Ensure we only keep the last `sampling_size` data points, trim if needed
-        while len(new_data_points) > self._sampling_size:
-            new_data_points.pop(0)
+    def restore(self, value, attributes):
+        """Restore the estimate and its deviation."""
+        self.value = value
+        self.deviation = float(attributes.get("deviation") or 0.0)
 
-        # Update the data points
-        self._data_points = new_data_points
+    def as_dict(self):
+        """Return the estimate and its deviation."""
+        return {**super().as_dict(), "deviation": self.deviation}
 
-        # Update count and last update time
-        self._last_updated = now.isoformat()
 
-        # Trigger an update in Home Assistant
-        self.async_write_ha_state()
+class MedianSensor(SmoothingAnalyticsStageSensor):
+    """Median filtered sensor with persistent state and device support."""
 
-    async def _resolve_input_entity_id(self):
-        """Resolve the entity_id from the unique_id using entity_registry."""
+    _stage_name = "median"
 
-        # Resolve the entity_id from the unique_id
-        registry = entity_registry.async_get(self.hass)
+    @property
+    def name(self):
+        return f"Median Filtered Sensor {self._sensor_hash}"
 
-        # Fetch the entity_id from the unique_id
-        entry = registry.async_get_entity_id("sensor", DOMAIN, self._input_unique_id)
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
 
-        # Log the resolved entity_id for debugging purposes
-        if entry:
-            self._input_entity_id = entry
+        if isinstance(self._stage, MedianSketchStage):
+            return {
+                **super().extra_state_attributes,
+                "deviation": self._stage.deviation,
+                "input_unique_id": self.upstream_unique_id,
+                "median_sampling_size": self._stage.sampling_size,
+                "type": "moving_median_sketch",
+            }
 
-            _LOGGER.debug(
-                f"Resolved entity_id for unique_id {self._input_unique_id}: {self._input_entity_id}"
-            )
-        else:
-            _LOGGER.warning(
-                f"Entity with unique_id {self._input_unique_id} not found in registry."
-            )
-
-    async def async_added_to_hass(self):
-        """Handle the sensor being added to Home Assistant."""
-
-        # Restore the previous state from persistent storage
-        old_state = await self.async_get_last_state()
-
-        if old_state is not None:
-            _LOGGER.info(f"Restoring state for {self._unique_id}")
-
-            try:
-                self._state = round(float(old_state.state), 2)
-                self._data_points = old_state.attributes.get("data_points", []) or []
-            except (ValueError, TypeError):
-                _LOGGER.warning(
-                    f"Could not restore state for {self._unique_id}, invalid value: {old_state.state}"
-                )
-                self._state = None
-                self._data_points = []
-
-            self._last_updated = old_state.attributes.get("last_updated", None)
-            self._update_interval = old_state.attributes.get("update_interval", 1)
-        else:
-            _LOGGER.info(
-                f"No previous state found for {self._unique_id}, starting fresh."
-            )
-
-        # Check if the input_entity_id has been resolved from unique_id
-        if not self._input_entity_id:
-            _LOGGER.debug(f"Resolving entity_id for unique_id {self._input_unique_id}")
-            await self._resolve_input_entity_id()
-
-        # Continue if input_entity_id is available
-        if not self._input_entity_id:
-            _LOGGER.warning(
-                f"Entity with unique_id {self._input_unique_id} not found. Unable to track state changes."
-            )
-            return
-
-        # Start listening for state changes of the input sensor
-        if self._input_entity_id:
-            _LOGGER.info(
-                f"Starting to track state changes for entity_id {self._input_entity_id}"
-            )
-            async_track_state_change_event(
-                self.hass, [self._input_entity_id], self._handle_update
-            )
-        else:
-            _LOGGER.error(
-                f"Failed to track state changes, input_entity_id is not resolved."
-            )
+        # Calculate the number of data points
+        data_points_count = len(self._stage.data_points)
+
+        # Calculate the number of missing data points
+        missing_data_points = max(0, self._stage.sampling_size - data_points_count)
+
+        return {
+            **super().extra_state_attributes,
+            "data_points": list(self._stage.data_points),
+            "data_points_count": data_points_count,
+            "input_unique_id": self.upstream_unique_id,
+            "median_sampling_size": self._stage.sampling_size,
+            "missing_data_points": missing_data_points,
+            "type": "moving_median",
+        }
@@ -0,0 +1,138 @@
+import logging
+from collections import deque
+from datetime import timedelta
+
+from homeassistant.components.sensor import SensorStateClass
+
+from ..const import (
+    ESTIMATED_SAMPLE_RATE,
+    SLOPE_WINDOW_UNIT_SAMPLES,
+    TIMED_SAMPLE_MEMORY,
+)
+from ..entity import SmoothingAnalyticsStageSensor
+from ..pipeline import PipelineStage
+
+_LOGGER = logging.getLogger(__name__)
+
+# Sample times are kept relative to an origin to keep the running sums precise.
+# Once the oldest sample is this far from the origin, the sums are rebuilt.
+REBASE_AFTER_SECONDS = 3600
+
+
+class SlopeStage(PipelineStage):
+    """Rate of change of the smoothed value by streaming least-squares regression.
+
+    The running sums of t, x, t*t and t*x are updated as samples enter and
+    leave the window, so every update is O(1) regardless of the window size.
+    """
+
+    stage_type = "slope"
+
+    def __init__(self, key, upstream, window, window_unit):
+        super().__init__(key, upstream)
+        self.window = window
+        self.window_unit = window_unit
+        self.samples = deque()
+        self._origin = None
+        self._sum_t = 0.0
+        self._sum_x = 0.0
+        self._sum_tt = 0.0
+        self._sum_tx = 0.0
+
+    def update(self, value):
+        """Add the value to the window and fit a line through the window."""
+        if self._origin is None:
+            self._origin = self.last_updated
+        t = (self.last_updated - self._origin).total_seconds()
+
+        self.samples.append((t, value))
+        self._add(t, value, 1)
+
+        # Slide the window
+        if self.window_unit == SLOPE_WINDOW_UNIT_SAMPLES:
+            while len(self.samples) > self.window:
+                self._add(*self.samples.popleft(), -1)
+        else:
+            while t - self.samples[0][0] > self.window:
+                self._add(*self.samples.popleft(), -1)
+
+        if self.samples[0][0] > REBASE_AFTER_SECONDS:
+            self._rebase()
+
+        n = len(self.samples)
+        denominator = n * self._sum_tt - self._sum_t * self._sum_t
+        if n >= 2 and denominator > 0:
+            self.value = (n * self._sum_tx - self._sum_t * self._sum_x) / denominator
+
+        return self.value
+
+    @classmethod
+    def estimate_memory(cls, window, window_unit):
+        """Return the memory of a full window in bytes."""
+        if window_unit == SLOPE_WINDOW_UNIT_SAMPLES:
+            return int(window) * TIMED_SAMPLE_MEMORY
+        return int(window * ESTIMATED_SAMPLE_RATE) * TIMED_SAMPLE_MEMORY
+
+    def memory_usage(self):
+        """Return the memory of the window in bytes."""
+        return len(self.samples) * TIMED_SAMPLE_MEMORY
+
+    def _add(self, t, x, sign):
+        """Add (sign=1) or remove (sign=-1) a sample from the running sums."""
+        self._sum_t += sign * t
+        self._sum_x += sign * x
+        self._sum_tt += sign * t * t
+        self._sum_tx += sign * t * x
+
+    def _rebase(self):
+        """Move the origin to the oldest sample and rebuild the running sums."""
+        shift = self.samples[0][0]
+        self._origin += timedelta(seconds=shift)
+        self.samples = deque((t - shift, x) for t, x in self.samples)
+        self._sum_t = self._sum_x = self._sum_tt = self._sum_tx = 0.0
+        for t, x in self.samples:
+            self._add(t, x, 1)
+
+    def reset(self):
+        """Forget the slope state."""
+        super().reset()
+        self.samples.clear()
+        self._origin = None
+        self._sum_t = self._sum_x = self._sum_tt = self._sum_tx = 0.0
+
+
+class SlopeSensor(SmoothingAnalyticsStageSensor):
+    """Rate of change of the EMA filtered sensor, per second."""
+
+    _stage_name = "slope"
+
+    # A rate of change has no device class, whatever the input measures
+    _attr_device_class = None
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    @property
+    def name(self):
+        return f"Slope Sensor {self._sensor_hash}"
+
+    @property
+    def native_value(self):
+        if self._stage.value is None:
+            return None
+        return round(self._stage.value, 4)
+
+    @property
+    def native_unit_of_measurement(self):
+        unit = self._stage.metadata.get("unit_of_measurement")
+        return f"{unit}/s" if unit else None
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+
+        return {
+            **super().extra_state_attributes,
+            "input_unique_id": f"sas_ema_{self.config_entry.entry_id}",
+            "slope_window": self._stage.window,
+            "slope_window_unit": self._stage.window_unit,
+            "slope_samples": len(self._stage.samples),
+        }
@@ -0,0 +1,174 @@
+import logging
+
+from homeassistant.components.binary_sensor import BinarySensorEntity
+from homeassistant.const import STATE_OFF, STATE_ON
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.util import dt as dt_util
+
+from ..entity import SmoothingAnalyticsEntity
+from ..pipeline import PipelineStage
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ThresholdStage(PipelineStage):
+    """Hysteresis threshold applied to the EMA filtered value.
+
+    The output turns on at or above the upper threshold and off at or below
+    the lower one, and only flips once the new side has held for the dwell
+    time. A flip that is due while no samples arrive is applied by
+    async_apply_pending.
+    """
+
+    stage_type = "threshold"
+
+    def __init__(self, key, upstream, upper, lower, dwell):
+        super().__init__(key, upstream)
+        self.upper = upper
+        self.lower = lower
+        self.dwell = dwell
+        self.pending_since = None
+
+    def update(self, value):
+        """Flip the output once the value has been past a threshold for the dwell time."""
+        if value >= self.upper:
+            target = True
+        elif value <= self.lower:
+            target = False
+        else:
+            target = self.value
+
+        # The first sample sets the output right away
+        if self.value is None:
+            self.value = target if target is not None else False
+            return self.value
+
+        if target == self.value:
+            self.pending_since = None
+            return self.value
+
+        if self.pending_since is None:
+            self.pending_since = self.last_updated
+        self._apply_pending(self.last_updated)
+        return self.value
+
+    @callback
+    def async_apply_pending(self, now):
+        """Apply a pending flip that is due, and notify the listeners."""
+        if self.pending_since is None or not self._apply_pending(now):
+            return
+
+        for update_callback in self._listeners:
+            update_callback()
+
+    def _apply_pending(self, now):
+        """Flip the output if the pending flip is due, return True if it flipped."""
+        if (now - self.pending_since).total_seconds() < self.dwell:
+            return False
+
+        self.value = not self.value
+        self.pending_since = None
+        return True
+
+    def reset(self):
+        """Forget the output and any pending flip."""
+        super().reset()
+        self.pending_since = None
+
+
+class ThresholdBinarySensor(
+    SmoothingAnalyticsEntity, BinarySensorEntity, RestoreEntity
+):
+    """Binary sensor publishing the threshold output, written only when it flips."""
+
+    _attr_should_poll = False
+
+    def __init__(self, pipeline, stage):
+        super().__init__(pipeline.config_entry)
+        self._pipeline = pipeline
+        self._stage = stage
+        self._sensor_hash = pipeline.sensor_hash
+        self._unique_id = f"sas_threshold_{pipeline.config_entry.entry_id}"
+        self._published = None
+        self._unsub_pending = None
+
+    @property
+    def name(self):
+        return f"Threshold Sensor {self._sensor_hash}"
+
+    @property
+    def unique_id(self):
+        return self._unique_id
+
+    @property
+    def available(self):
+        return self._pipeline.available
+
+    @property
+    def is_on(self):
+        return self._stage.value
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+
+        return {
+            "dwell": self._stage.dwell,
+            "input_unique_id": f"sas_ema_{self.config_entry.entry_id}",
+            "lower_threshold": self._stage.lower,
+            "sensor_hash": self._sensor_hash,
+            "type": self._stage.stage_type,
+            "unique_id": self._unique_id,
+            "upper_threshold": self._stage.upper,
+        }
+
+    async def async_added_to_hass(self):
+        """Handle the binary sensor being added to Home Assistant."""
+        await super().async_added_to_hass()
+
+        if self._stage.value is None:
+            old_state = await self.async_get_last_state()
+            if old_state is not None and old_state.state in (STATE_ON, STATE_OFF):
+                _LOGGER.debug(f"Restoring state for {self._unique_id}")
+                self._stage.restore(old_state.state == STATE_ON, old_state.attributes)
+
+        self._published = self._stage.value
+        self.async_on_remove(self._stage.async_add_listener(self._handle_stage_update))
+        self.async_on_remove(
+            self._pipeline.async_add_stale_listener(self.async_write_ha_state)
+        )
+        self.async_on_remove(self._async_cancel_pending)
+
+    @callback
+    def _handle_stage_update(self):
+        """Write the state when the output flipped, and wait for a pending flip."""
+        if self._stage.value != self._published:
+            self._published = self._stage.value
+            self.async_write_ha_state()
+
+        # Only keep a timer while a flip is pending
+        if self._stage.pending_since is None:
+            self._async_cancel_pending()
+        elif self._unsub_pending is None:
+            elapsed = (dt_util.utcnow() - self._stage.pending_since).total_seconds()
+            self._unsub_pending = async_call_later(
+                self.hass, max(self._stage.dwell - elapsed, 0), self._async_pending_due
+            )
+
+    @callback
+    def _async_pending_due(self, now):
+        """Apply the pending flip once the dwell time has passed without new samples."""
+        self._unsub_pending = None
+        self._stage.async_apply_pending(now)
+
+        # Wait again if the flip was not quite due yet
+        self._handle_stage_update()
+
+    @callback
+    def _async_cancel_pending(self):
+        """Cancel the timer of a pending flip."""
+        if self._unsub_pending is not None:
+            self._unsub_pending()
+            self._unsub_pending = None
@@ -0,0 +1,72 @@
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry):
+    """Return diagnostics for a config entry."""
+    manager = hass.data[DOMAIN]
+    pipeline = manager.pipelines.get(entry.entry_id)
+
+    diagnostics = {
+        "data": dict(entry.data),
+        "options": dict(entry.options),
+        "load_scheduler": manager.scheduler.as_dict(),
+        "integration_memory": {
+            "usage": manager.memory_usage(),
+            "cap": manager.memory_cap,
+        },
+    }
+    if pipeline is None:
+        return diagnostics
+
+    diagnostics["setup_time"] = pipeline.setup_time
+    diagnostics["stages"] = {
+        name: {
+            "key": repr(stage.key),
+            "shared_by": stage.refcount,
+            "value": stage.value,
+            "last_updated": stage.last_updated,
+            "update_interval": stage.update_interval,
+            "memory_usage": stage.memory_usage(),
+        }
+        for name, stage in pipeline.stages.items()
+    }
+
+    diagnostics["memory"] = {
+        "usage": pipeline.memory_usage(),
+        "degraded": pipeline.degraded,
+    }
+
+    # Samples replaced by the Hampel stage
+    if "hampel" in pipeline.stages:
+        hampel_stage = pipeline.stages["hampel"]
+        diagnostics["outliers"] = {
+            "samples": hampel_stage.samples,
+            "rejected": hampel_stage.rejected,
+            "rejection_rate": (
+                hampel_stage.rejected / hampel_stage.samples
+                if hampel_stage.samples
+                else None
+            ),
+        }
+
+    diagnostics["shadows"] = {
+        name: {
+            "settings": shadow["settings"],
+            "stages": {
+                stage_name: repr(stage.key)
+                for stage_name, stage in shadow["stages"].items()
+            },
+            "comparison": shadow["comparison"].as_dict(),
+        }
+        for name, shadow in pipeline.shadows.items()
+    }
+
+    input_stage = pipeline.input_stage
+    diagnostics["load"] = {
+        "load_level": input_stage.load_level,
+        **input_stage.load_stats.as_dict(manager.scheduler.window_seconds),
+    }
+    return diagnostics
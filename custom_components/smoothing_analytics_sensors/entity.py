@@ -1,8 +1,22 @@
 import logging
+import time
 
+from homeassistant.components.sensor import SensorEntity
+from homeassistant.core import callback
 from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.helpers.start import async_at_started
 
-from .const import DOMAIN, ICON, NAME
+from .const import (
+    DEFAULT_IMPORT_STATISTICS,
+    DEFAULT_PUBLISH_INTERVAL,
+    DOMAIN,
+    ICON,
+    NAME,
+)
+from .long_term_statistics import StatisticsAggregator, statistic_id_for
+from .utils.misc import get_config_value
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -37,3 +51,196 @@ class SmoothingAnalyticsEntity(Entity):
             "name": self.config_entry.data.get("device_name", NAME),
             "manufacturer": NAME,
         }
+
+
+class SmoothingAnalyticsStageSensor(
+    SmoothingAnalyticsEntity, SensorEntity, RestoreEntity
+):
+    """Base class for sensors publishing the output of a pipeline stage."""
+
+    # Stage states are pushed by the pipeline, never polled
+    _attr_should_poll = False
+
+    # Name of the stage in the pipeline, also used in the unique_id
+    _stage_name = None
+
+    # Lower bound of the minimum time between state writes of this sensor
+    _min_publish_interval = 0
+
+    # Whether the output is aggregated into imported long-term statistics
+    _import_statistics = True
+
+    def __init__(self, pipeline, stage):
+        super().__init__(pipeline.config_entry)
+        self._pipeline = pipeline
+        self._stage = stage
+        self._sensor_hash = pipeline.sensor_hash
+        self._unique_id = f"sas_{self._stage_name}_{pipeline.config_entry.entry_id}"
+        self._publish_interval = get_config_value(
+            pipeline.config_entry, "publish_interval", DEFAULT_PUBLISH_INTERVAL
+        )
+        self._last_published = None
+        self._unsub_publish = None
+        self._statistics = None
+
+    @property
+    def unique_id(self):
+        return self._unique_id
+
+    @property
+    def upstream_unique_id(self):
+        """Return the unique_id of the sensor publishing the upstream stage."""
+        for name, stage in self._pipeline.stages.items():
+            if stage is self._stage.upstream:
+                return f"sas_{name}_{self.config_entry.entry_id}"
+        return None
+
+    @property
+    def stage_value(self):
+        """Return the unrounded stage output published by this sensor."""
+        return self._stage.value
+
+    @property
+    def native_value(self):
+        if self.stage_value is None:
+            return None
+        return round(self.stage_value, 2)
+
+    @property
+    def available(self):
+        return self._pipeline.available
+
+    @property
+    def native_unit_of_measurement(self):
+        return self._stage.metadata.get("unit_of_measurement")
+
+    # Sensors with a device or state class of their own do not mirror the input
+    @property
+    def device_class(self):
+        if hasattr(self, "_attr_device_class"):
+            return self._attr_device_class
+        return self._stage.metadata.get("device_class")
+
+    @property
+    def state_class(self):
+        if hasattr(self, "_attr_state_class"):
+            return self._attr_state_class
+        return self._stage.metadata.get("state_class")
+
+    @property
+    def last_reset(self):
+        return None
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes shared by every stage sensor."""
+        last_updated = self._stage.last_updated
+
+        return {
+            "last_updated": last_updated.isoformat() if last_updated else None,
+            "sensor_hash": self._sensor_hash,
+            "sensor_update_interval": self._stage.update_interval,
+            "type": self._stage.stage_type,
+            "unique_id": self._unique_id,
+        }
+
+    async def async_added_to_hass(self):
+        """Handle the sensor being added to Home Assistant."""
+        await super().async_added_to_hass()
+
+        # Fall back to the previous state when the stage was not restored from the
+        # pipeline store or by another entry sharing it
+        if self.stage_value is None:
+            old_state = await self.async_get_last_state()
+
+            if old_state is not None:
+                _LOGGER.debug(f"Restoring state for {self._unique_id}")
+                try:
+                    self.restore_stage(float(old_state.state), old_state.attributes)
+                except (ValueError, TypeError):
+                    _LOGGER.debug(
+                        f"Could not restore state for {self._unique_id}, invalid value: {old_state.state}"
+                    )
+            else:
+                _LOGGER.debug(
+                    f"No previous state found for {self._unique_id}, starting fresh."
+                )
+
+        # Aggregate the unrounded output into long-term statistics
+        if self._import_statistics and get_config_value(
+            self.config_entry, "import_statistics", DEFAULT_IMPORT_STATISTICS
+        ):
+            self._statistics = StatisticsAggregator(
+                self.hass,
+                statistic_id_for(self._stage_name, self.config_entry.entry_id),
+                f"{self.config_entry.title} {self.name}",
+                lambda: self.unit_of_measurement,
+            )
+            self.async_on_remove(
+                async_at_started(self.hass, self._async_start_statistics)
+            )
+            self.async_on_remove(self._statistics.async_stop)
+
+        # Publish the updates of the stage
+        self.async_on_remove(self._stage.async_add_listener(self._handle_stage_update))
+        self.async_on_remove(self._async_cancel_publish)
+        self.async_on_remove(
+            self._pipeline.async_add_stale_listener(self.async_write_ha_state)
+        )
+
+    def restore_stage(self, value, attributes):
+        """Restore the stage from the previous state of the sensor."""
+        self._stage.restore(value, attributes)
+
+    @callback
+    def _async_start_statistics(self, _hass):
+        """Start closing statistics periods once Home Assistant has started."""
+        self._statistics.async_start()
+
+    @callback
+    def _handle_stage_update(self):
+        """Handle a new stage output."""
+        if self._statistics is not None and self.stage_value is not None:
+            self._statistics.async_add(self.stage_value, self._stage.last_updated)
+
+        # A write is already scheduled and will publish the latest output
+        if self._unsub_publish is not None:
+            return
+
+        # The load scheduler may lower the publish rate of a flooding input
+        publish_interval = max(
+            self._publish_interval,
+            self._min_publish_interval,
+            self._pipeline.input_stage.min_publish_interval,
+        )
+        if not publish_interval:
+            self.async_write_ha_state()
+            return
+
+        # Throttle the state writes to at most one per publish interval
+        now = time.monotonic()
+        if self._last_published is None or (
+            now - self._last_published >= publish_interval
+        ):
+            self._last_published = now
+            self.async_write_ha_state()
+        else:
+            self._unsub_publish = async_call_later(
+                self.hass,
+                publish_interval - (now - self._last_published),
+                self._async_publish_later,
+            )
+
+    @callback
+    def _async_publish_later(self, _now):
+        """Write the latest stage output once the publish interval has passed."""
+        self._unsub_publish = None
+        self._last_published = time.monotonic()
+        self.async_write_ha_state()
+
+    @callback
+    def _async_cancel_publish(self):
+        """Cancel a scheduled state write."""
+        if self._unsub_publish is not None:
+            self._unsub_publish()
+            self._unsub_publish = None
@@ -0,0 +1,130 @@
+import logging
+from datetime import timedelta
+
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+)
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_utc_time_change
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# The recorder only accepts imported long-term statistics per hour
+STATISTICS_PERIOD = timedelta(hours=1)
+
+
+def statistic_id_for(stage_name, entry_id):
+    """Return the external statistic_id of a stage sensor."""
+    return f"{DOMAIN}:{stage_name}_{entry_id.lower()}"
+
+
+class StatisticsAggregator:
+    """Aggregate a stage output in memory and import it as long-term statistics.
+
+    The mean is time-weighted, every value is held until the next one arrives,
+    just like the recorder does when it compiles statistics from states.
+    """
+
+    def __init__(self, hass, statistic_id, name, get_unit_of_measurement):
+        self.hass = hass
+        self.statistic_id = statistic_id
+        self.name = name
+        self._get_unit_of_measurement = get_unit_of_measurement
+        self._period_start = None
+        self._last_value = None
+        self._last_timestamp = None
+        self._weighted_sum = 0.0
+        self._duration = 0.0
+        self._min = None
+        self._max = None
+        self._unsub = None
+
+    @callback
+    def async_start(self):
+        """Close every period on the hour, also when the output is not updated."""
+        self._unsub = async_track_utc_time_change(
+            self.hass, self._async_handle_period_end, minute=0, second=5
+        )
+
+    @callback
+    def async_stop(self):
+        """Stop closing periods."""
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def async_add(self, value, timestamp):
+        """Add a stage output to the current period."""
+        if self._last_timestamp is None:
+            self._period_start = timestamp.replace(minute=0, second=0, microsecond=0)
+            self._min = self._max = value
+        else:
+            self._async_advance(timestamp)
+            self._min = min(self._min, value)
+            self._max = max(self._max, value)
+
+        self._last_value = value
+        self._last_timestamp = timestamp
+
+    @callback
+    def _async_handle_period_end(self, now):
+        """Import the period that just ended."""
+        if self._last_timestamp is not None:
+            self._async_advance(now)
+
+    @callback
+    def _async_advance(self, until):
+        """Hold the last value until the given time, importing every finished period."""
+        while until >= self._period_start + STATISTICS_PERIOD:
+            period_end = self._period_start + STATISTICS_PERIOD
+            self._accumulate(period_end)
+            self._async_import_period()
+
+            # The held value carries over into the next period
+            self._period_start = period_end
+            self._weighted_sum = 0.0
+            self._duration = 0.0
+            self._min = self._max = self._last_value
+
+        self._accumulate(until)
+
+    def _accumulate(self, until):
+        """Weigh the last value by the time it was held."""
+        seconds = (until - self._last_timestamp).total_seconds()
+        if seconds > 0:
+            self._weighted_sum += self._last_value * seconds
+            self._duration += seconds
+            self._last_timestamp = until
+
+    @callback
+    def _async_import_period(self):
+        """Import the aggregates of the current period."""
+        if self._duration > 0:
+            mean = self._weighted_sum / self._duration
+        else:
+            mean = self._last_value
+
+        metadata = {
+            "has_mean": True,
+            "has_sum": False,
+            "name": self.name,
+            "source": DOMAIN,
+            "statistic_id": self.statistic_id,
+            "unit_of_measurement": self._get_unit_of_measurement(),
+        }
+        statistics = [
+            {
+                "start": self._period_start,
+                "mean": mean,
+                "min": self._min,
+                "max": self._max,
+            }
+        ]
+
+        _LOGGER.debug(
+            f"Importing statistics for {self.statistic_id} at {self._period_start}: {statistics}"
+        )
+        async_add_external_statistics(self.hass, metadata, statistics)
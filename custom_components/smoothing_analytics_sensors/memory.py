@@ -0,0 +1,80 @@
+import logging
+
+from .const import (
+    DEFAULT_FIR_METHOD,
+    DEFAULT_HAMPEL_MODE,
+    DEFAULT_HAMPEL_THRESHOLD,
+    DEFAULT_HAMPEL_WINDOW,
+    DEFAULT_LOW_PASS,
+    DEFAULT_MEDIAN_SIZE,
+    DEFAULT_SAMPLE_LOG_SIZE,
+    DEFAULT_SHADOW_PIPELINES,
+    DEFAULT_SLOPE_WINDOW,
+    DEFAULT_SLOPE_WINDOW_UNIT,
+    FIR_METHOD_NONE,
+    HAMPEL_MODE_NONE,
+    HAMPEL_MODE_REPLACE_MEDIAN,
+    SHADOW_SETTINGS,
+)
+from .custom_sensors.fir_sensor import FirStage, fir_coefficients
+from .custom_sensors.hampel_sensor import HampelStage
+from .custom_sensors.median_sensor import MedianStage
+from .custom_sensors.slope_sensor import SlopeStage
+from .sample_log import SampleLog
+from .utils.misc import parse_shadow_pipelines
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def estimate_memory(get_value):
+    """Return the approximate memory the buffers of a pipeline will hold, in bytes.
+
+    get_value(key, default) returns a setting of the pipeline, so the estimate
+    works for config entries as well as for settings submitted in a flow.
+    """
+    hampel_mode = get_value("hampel_mode", DEFAULT_HAMPEL_MODE)
+    hampel_memory = 0
+    if hampel_mode != HAMPEL_MODE_NONE:
+        hampel_memory = HampelStage.estimate_memory(
+            window=int(get_value("hampel_window", DEFAULT_HAMPEL_WINDOW)),
+            threshold=get_value("hampel_threshold", DEFAULT_HAMPEL_THRESHOLD),
+        )
+
+    def median_memory(sampling_size):
+        if hampel_mode == HAMPEL_MODE_REPLACE_MEDIAN:
+            return 0
+        return MedianStage.estimate_memory(sampling_size=int(sampling_size))
+
+    lowpass_time_constant = get_value("lowpass_time_constant", DEFAULT_LOW_PASS)
+    median_sampling_size = get_value("median_sampling_size", DEFAULT_MEDIAN_SIZE)
+    memory = hampel_memory + median_memory(median_sampling_size)
+
+    # Shadow pipelines only add the stages whose input or window they change
+    for overrides in parse_shadow_pipelines(
+        get_value("shadow_pipelines", DEFAULT_SHADOW_PIPELINES), SHADOW_SETTINGS
+    ):
+        shadow_sampling_size = overrides.get(
+            "median_sampling_size", median_sampling_size
+        )
+        if (
+            overrides.get("lowpass_time_constant", lowpass_time_constant)
+            != lowpass_time_constant
+        ):
+            memory += hampel_memory + median_memory(shadow_sampling_size)
+        elif shadow_sampling_size != median_sampling_size:
+            memory += median_memory(shadow_sampling_size)
+
+    slope_window = get_value("slope_window", DEFAULT_SLOPE_WINDOW)
+    if slope_window:
+        memory += SlopeStage.estimate_memory(
+            window=slope_window,
+            window_unit=get_value("slope_window_unit", DEFAULT_SLOPE_WINDOW_UNIT),
+        )
+
+    if get_value("fir_method", DEFAULT_FIR_METHOD) != FIR_METHOD_NONE:
+        memory += FirStage.estimate_memory(coefficients=fir_coefficients(get_value))
+
+    memory += SampleLog.estimate_memory(
+        int(get_value("sample_log_size", DEFAULT_SAMPLE_LOG_SIZE))
+    )
+    return memory
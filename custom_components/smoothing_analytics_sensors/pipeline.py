@@ -0,0 +1,822 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import timedelta
+from statistics import fmean
+
+from homeassistant.const import (
+    EVENT_HOMEASSISTANT_STOP,
+    STATE_UNAVAILABLE,
+    STATE_UNKNOWN,
+)
+from homeassistant.core import callback
+from homeassistant.helpers.event import (
+    async_track_state_change_event,
+    async_track_time_interval,
+)
+from homeassistant.helpers.start import async_at_started
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DECIMATION_FACTOR,
+    DEFAULT_CPU_BUDGET,
+    DEFAULT_INPUT_AGGREGATION,
+    DOMAIN,
+    LOAD_LEVEL_DECIMATE,
+    LOAD_LEVEL_NORMAL,
+    LOAD_LEVEL_THROTTLE_PUBLISH,
+    SHED_PUBLISH_INTERVAL,
+    STALE_BEHAVIOR_DECAY,
+    STALE_BEHAVIOR_UNAVAILABLE,
+    UNAVAILABLE_BEHAVIOR_DECAY,
+    UNAVAILABLE_BEHAVIOR_HOLD,
+    UNAVAILABLE_BEHAVIOR_RESET,
+)
+from .sample_log import SampleLog
+from .scheduler import LoadScheduler, LoadStats
+from .shadow import ShadowComparison
+from .utils.misc import generate_md5_hash
+from .utils.timer_wheel import TimerWheel
+
+_LOGGER = logging.getLogger(__name__)
+
+# The state of every stage is persisted in a single store
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.pipelines"
+SAVE_INTERVAL = timedelta(minutes=15)
+
+# Functions combining the latest values of several input sensors
+INPUT_AGGREGATIONS = {
+    "sum": sum,
+    "mean": fmean,
+    "min": min,
+    "max": max,
+}
+
+
+def input_stage_key(
+    entity_ids, aggregation, unavailable_behavior, stale_decay_timeout=0
+):
+    """Return the key of the shared input stage of the input sensors.
+
+    A stale input decays every stage fed by the input stage, so only entries
+    decaying after the same stale timeout share it. The timeout is left out of
+    the key of entries that do not decay, keeping the keys of stored stages.
+    """
+    entity_ids = tuple(entity_ids)
+
+    # A single input sensor is passed through as is
+    if len(entity_ids) == 1:
+        aggregation = None
+
+    key = (InputStage.stage_type, entity_ids, aggregation, unavailable_behavior)
+    if stale_decay_timeout:
+        key += (stale_decay_timeout,)
+    return key
+
+
+def sample_log_path(hass, key):
+    """Return the path of the raw sample log of an input stage."""
+    return hass.config.path(".storage", DOMAIN, f"{generate_md5_hash(repr(key))}.bin")
+
+
+class PipelineStage:
+    """A node in the shared stage graph, fanned out to downstream stages and entities."""
+
+    stage_type = None
+
+    def __init__(self, key, upstream=None):
+        self.key = key
+        self.upstream = upstream
+        self.children = []
+        self.value = None
+        self.last_updated = None
+        self.update_interval = 1
+        self.refcount = 0
+        self._listeners = []
+
+    @property
+    def metadata(self):
+        """Return the unit_of_measurement, device_class and state_class of the input."""
+        return self.upstream.metadata
+
+    @callback
+    def async_add_listener(self, update_callback):
+        """Register a callback invoked after every update of this stage."""
+        self._listeners.append(update_callback)
+
+        @callback
+        def remove_listener():
+            self._listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def async_push(self, value, timestamp):
+        """Feed a new upstream value through this stage and every stage below it."""
+
+        # Calculate the update interval from the sample timestamps
+        if self.last_updated is not None:
+            interval = (timestamp - self.last_updated).total_seconds()
+            if interval > 0:
+                self.update_interval = interval
+
+        # Stages needing the sample time read it from last_updated
+        self.last_updated = timestamp
+        output = self.update(value)
+
+        for update_callback in self._listeners:
+            update_callback()
+
+        # Stages without an output yet (e.g. a median window still filling) stop here
+        if output is None:
+            return
+
+        for child in self.children:
+            child.async_push(output, timestamp)
+
+    @callback
+    def async_reset(self):
+        """Clear this stage and every stage below it."""
+        self.reset()
+
+        for update_callback in self._listeners:
+            update_callback()
+
+        for child in self.children:
+            child.async_reset()
+
+    def update(self, value):
+        """Apply the stage filter to a new value and return the output, or None."""
+        raise NotImplementedError
+
+    def reset(self):
+        """Forget the filter state, the next value starts the stage fresh."""
+        self.value = None
+        self.last_updated = None
+        self.update_interval = 1
+
+    def restore(self, value, attributes):
+        """Restore the stage from a previously published state."""
+        self.value = value
+
+    @classmethod
+    def estimate_memory(cls, **params):
+        """Return the approximate memory the buffers of the stage will hold, in bytes."""
+        return 0
+
+    def memory_usage(self):
+        """Return the approximate memory held by the buffers of the stage, in bytes."""
+        return 0
+
+    def as_dict(self):
+        """Return the filter state to persist across restarts."""
+        return {"value": self.value}
+
+    def from_dict(self, data):
+        """Restore the filter state persisted by as_dict."""
+        self.restore(data.get("value"), data)
+
+
+class InputStage(PipelineStage):
+    """Root stage listening to the input sensors and parsing their states.
+
+    Events are gated before they reach the filters: attribute-only changes and
+    repeated events for an already processed sample are dropped, and the unit
+    and device_class are only re-read when the attributes actually change.
+
+    With several input sensors the latest value of every input is kept, and
+    their aggregate is pushed through the pipeline in the same callback.
+
+    The load scheduler may degrade the stage when its inputs flood the event
+    loop, in which case samples are decimated or coalesced before the filters.
+    """
+
+    stage_type = "input"
+
+    def __init__(self, key, hass, entity_ids, aggregation, unavailable_behavior):
+        super().__init__(key)
+        self.hass = hass
+        self.load_level = LOAD_LEVEL_NORMAL
+        self.load_stats = LoadStats()
+        self._decimation_count = 0
+        self._pending = None
+        self.sample_log = None
+        self.sample_log_lock = asyncio.Lock()
+        self.entity_ids = entity_ids
+        self.aggregation = aggregation
+        self.unavailable_behavior = unavailable_behavior
+        self._aggregate = INPUT_AGGREGATIONS.get(aggregation)
+        self._values = {}
+        self._timestamps = {}
+        self._unavailable = set()
+        self._metadata = {}
+        self._attributes = None
+        self._unsub = None
+        self._unsub_decay = None
+        self._sample_listeners = []
+
+    @property
+    def available(self):
+        """Return True if every input sensor is available."""
+        return not self._unavailable
+
+    @property
+    def metadata(self):
+        """Return the unit_of_measurement, device_class and state_class of the input."""
+        return self._metadata
+
+    @property
+    def min_publish_interval(self):
+        """Return the publish interval imposed on the sensors by the load scheduler."""
+        if self.load_level >= LOAD_LEVEL_THROTTLE_PUBLISH:
+            return SHED_PUBLISH_INTERVAL
+        return 0
+
+    @callback
+    def async_add_sample_listener(self, sample_callback):
+        """Register a callback invoked for every new sample of the input sensors.
+
+        Unlike the stage listeners, it is not invoked for decayed or replayed samples.
+        """
+        self._sample_listeners.append(sample_callback)
+
+        @callback
+        def remove_listener():
+            self._sample_listeners.remove(sample_callback)
+
+        return remove_listener
+
+    @callback
+    def async_start(self):
+        """Start listening for state changes of the input sensors."""
+        _LOGGER.debug(f"Starting to track state changes for {self.entity_ids}")
+
+        # Seed the latest values, so inputs holding a steady value, e.g. an
+        # unused phase at 0 W, do not block the aggregate until they change
+        for entity_id in self.entity_ids:
+            state = self.hass.states.get(entity_id)
+            if state is None:
+                continue
+            try:
+                value = float(state.state)
+            except ValueError:
+                continue
+            if not math.isfinite(value):
+                continue
+
+            self._values[entity_id] = value
+            self._timestamps[entity_id] = state.last_updated
+            if entity_id == self.entity_ids[0]:
+                self._update_metadata(state.attributes)
+
+        self._unsub = async_track_state_change_event(
+            self.hass, list(self.entity_ids), self._handle_event
+        )
+
+    @callback
+    def async_stop(self):
+        """Stop listening for state changes of the input sensors."""
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+        self.async_stop_decay()
+
+        if self.sample_log is not None:
+            self.hass.async_add_executor_job(self.sample_log.close)
+            self.sample_log = None
+
+    def update(self, value):
+        """Pass the parsed (aggregated) input value through unchanged."""
+        self.value = value
+        return value
+
+    @callback
+    def _async_push_sample(self, value, timestamp):
+        """Log a real input sample and push it through the pipeline.
+
+        Decayed and replayed samples are pushed directly, so they are not logged.
+        """
+        if self.sample_log is not None:
+            self.sample_log.append(timestamp.timestamp(), value)
+        self.async_push(value, timestamp)
+
+    def memory_usage(self):
+        """Return the size of the sample log mapped into memory, in bytes."""
+        if self.sample_log is None:
+            return 0
+        return self.sample_log.size
+
+    @callback
+    def async_replay(self, samples):
+        """Rebuild every stage below from logged (timestamp, value) samples."""
+        self.async_reset()
+        for timestamp, value in samples:
+            self.async_push(value, dt_util.utc_from_timestamp(timestamp))
+
+    @callback
+    def _handle_event(self, event):
+        """Handle a state change and account the time it took."""
+        start = time.perf_counter()
+        self._async_process_event(event)
+        self.load_stats.async_record(time.perf_counter() - start)
+
+    @callback
+    def _async_process_event(self, event):
+        """Handle a state change of one of the input sensors."""
+        entity_id = event.data["entity_id"]
+        new_state = event.data["new_state"]
+        if new_state is None or new_state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN):
+            self._async_handle_unavailable(entity_id)
+            return
+
+        # The unit and device_class are taken from the first input sensor
+        is_primary = entity_id == self.entity_ids[0]
+
+        # Attribute-only change, refresh the cached metadata but skip the filters
+        old_state = event.data["old_state"]
+        if (
+            old_state is not None
+            and old_state.state == new_state.state
+            and new_state.attributes is not old_state.attributes
+            and new_state.attributes != old_state.attributes
+        ):
+            if is_primary:
+                self._update_metadata(new_state.attributes)
+            return
+
+        try:
+            input_value = float(new_state.state)
+        except ValueError:
+            _LOGGER.debug(f"Invalid value from {entity_id}: {new_state.state}")
+            return
+
+        # NaN and infinite values would poison the state of the recursive filters
+        if not math.isfinite(input_value):
+            _LOGGER.debug(f"Non-finite value from {entity_id}: {new_state.state}")
+            return
+
+        # Same sample delivered again
+        sample = (input_value, new_state.last_updated)
+        if sample == (self._values.get(entity_id), self._timestamps.get(entity_id)):
+            return
+
+        self._values[entity_id] = input_value
+        self._timestamps[entity_id] = new_state.last_updated
+
+        for sample_callback in self._sample_listeners:
+            sample_callback()
+
+        if entity_id in self._unavailable:
+            self._unavailable.discard(entity_id)
+            if not self._unavailable:
+                _LOGGER.debug(f"Sensors {self.entity_ids} are available again")
+                self.async_stop_decay()
+
+        if is_primary and new_state.attributes is not self._attributes:
+            self._update_metadata(new_state.attributes)
+
+        # Wait until every input has reported
+        if len(self._values) < len(self.entity_ids):
+            return
+
+        if self._aggregate is not None:
+            input_value = self._aggregate(self._values.values())
+
+        if self.load_level == LOAD_LEVEL_NORMAL:
+            self._async_push_sample(input_value, new_state.last_updated)
+        elif self.load_level == LOAD_LEVEL_DECIMATE:
+            self._decimation_count += 1
+            if self._decimation_count >= DECIMATION_FACTOR:
+                self._decimation_count = 0
+                self._async_push_sample(input_value, new_state.last_updated)
+        else:
+            # Coalesced, the scheduler pushes the latest sample once per tick
+            self._pending = (input_value, new_state.last_updated)
+
+    @callback
+    def async_flush_pending(self):
+        """Push the latest coalesced sample through the pipeline."""
+        if self._pending is None:
+            return
+
+        start = time.perf_counter()
+        pending, self._pending = self._pending, None
+        self._async_push_sample(*pending)
+        self.load_stats.async_record(time.perf_counter() - start, events=0)
+
+    def _update_metadata(self, attributes):
+        """Cache unit_of_measurement, device_class and state_class of the input."""
+        self._attributes = attributes
+        self._metadata = {
+            "unit_of_measurement": attributes.get("unit_of_measurement"),
+            "device_class": attributes.get("device_class"),
+            "state_class": attributes.get("state_class"),
+        }
+
+    @callback
+    def _async_handle_unavailable(self, entity_id):
+        """Apply the configured behavior when an input becomes unavailable."""
+        self._values.pop(entity_id, None)
+        self._timestamps.pop(entity_id, None)
+
+        if not self.available:
+            self._unavailable.add(entity_id)
+            return
+
+        _LOGGER.debug(
+            f"Sensor {entity_id} is unavailable, applying {self.unavailable_behavior}"
+        )
+        self._unavailable.add(entity_id)
+
+        if self.unavailable_behavior == UNAVAILABLE_BEHAVIOR_RESET:
+            self.async_reset()
+        elif self.unavailable_behavior == UNAVAILABLE_BEHAVIOR_DECAY:
+            self.async_start_decay()
+
+    @callback
+    def async_start_decay(self):
+        """Decay the pipeline until the input reports again."""
+        if self._unsub_decay is not None:
+            return
+
+        # Feed zeros at the last known input rate, so every stage decays
+        # with its own dynamics until the input reports again
+        interval = min(max(self.update_interval, 1), 60)
+        self._unsub_decay = async_track_time_interval(
+            self.hass, self._async_decay, timedelta(seconds=interval)
+        )
+
+    @callback
+    def _async_decay(self, now):
+        """Push a zero sample through the pipeline while the input is unavailable."""
+        if self.value is None:
+            return
+        self.async_push(0.0, dt_util.utcnow())
+
+    @callback
+    def async_stop_decay(self):
+        """Stop decaying the pipeline."""
+        if self._unsub_decay is not None:
+            self._unsub_decay()
+            self._unsub_decay = None
+
+
+class Pipeline:
+    """The stages acquired by a single config entry."""
+
+    def __init__(self, manager, config_entry):
+        self.manager = manager
+        self.config_entry = config_entry
+        self.sensor_hash = None
+        self.setup_time = None
+        self.stages = {}
+        self.shadows = {}
+        self.degraded = False
+        self.stale = False
+        self.stale_behavior = STALE_BEHAVIOR_UNAVAILABLE
+        self._stale_timer = None
+        self._stale_listeners = []
+        self._unsub_sample = None
+        self._release_listeners = []
+
+    @property
+    def available(self):
+        """Return False while the input is stale and the sensors should show it."""
+        return not (self.stale and self.stale_behavior == STALE_BEHAVIOR_UNAVAILABLE)
+
+    @property
+    def input_stage(self):
+        """Return the root stage of the pipeline."""
+        return self.stages["input"]
+
+    def held_stages(self):
+        """Return every stage held by the pipeline and its shadow pipelines, by key."""
+        stages = {stage.key: stage for stage in self.stages.values()}
+        for shadow in self.shadows.values():
+            stages.update((stage.key, stage) for stage in shadow["stages"].values())
+        return stages
+
+    def memory_usage(self):
+        """Return the approximate memory held by the stages of the pipeline, in bytes."""
+        return sum(stage.memory_usage() for stage in self.held_stages().values())
+
+    @callback
+    def async_add_input(
+        self,
+        entity_ids,
+        aggregation=DEFAULT_INPUT_AGGREGATION,
+        unavailable_behavior=UNAVAILABLE_BEHAVIOR_HOLD,
+        stale_decay_timeout=0,
+    ):
+        """Acquire the shared input stage for the given input sensors."""
+        self.sensor_hash = generate_md5_hash(",".join(entity_ids))
+        stage = self.manager.async_acquire_input(
+            entity_ids, aggregation, unavailable_behavior, stale_decay_timeout
+        )
+        self.stages["input"] = stage
+        return stage
+
+    async def async_open_sample_log(self, capacity):
+        """Log the input samples to a memory-mapped ring file and replay it.
+
+        The log belongs to the input stage, so entries sharing the stage share
+        it, and it is grown to the largest capacity asked for. Only a newly
+        created input stage is rebuilt from the log, stages shared with other
+        entries are already running.
+        """
+        input_stage = self.input_stage
+        hass = self.manager.hass
+
+        # Entries are set up concurrently, open the log of a stage only once
+        async with input_stage.sample_log_lock:
+            sample_log = input_stage.sample_log
+            if sample_log is not None:
+                if sample_log.capacity < capacity:
+                    # Samples arriving while the file is resized are not logged
+                    input_stage.sample_log = None
+                    await hass.async_add_executor_job(sample_log.resize, capacity)
+                    input_stage.sample_log = sample_log
+                return
+
+            sample_log = SampleLog(sample_log_path(hass, input_stage.key), capacity)
+            await hass.async_add_executor_job(sample_log.open)
+
+            if input_stage.refcount == 1:
+                samples = await hass.async_add_executor_job(sample_log.read)
+                if samples:
+                    _LOGGER.debug(
+                        f"Replaying {len(samples)} samples of {input_stage.entity_ids}"
+                    )
+                    input_stage.async_replay(samples)
+
+            input_stage.sample_log = sample_log
+
+    @callback
+    def async_track_stale(self, timeout, behavior):
+        """Mark the pipeline stale when the input reports nothing for timeout seconds.
+
+        Every sample only moves the deadline on the shared timer wheel ahead.
+        """
+        self.stale_behavior = behavior
+        self._stale_timer = self.manager.timer_wheel.async_create_timer(
+            timeout, self._async_handle_stale
+        )
+        self._stale_timer.async_refresh()
+        self._unsub_sample = self.input_stage.async_add_sample_listener(
+            self._async_handle_sample
+        )
+
+    @callback
+    def async_add_stale_listener(self, update_callback):
+        """Register a callback invoked when the pipeline becomes stale or fresh."""
+        self._stale_listeners.append(update_callback)
+
+        @callback
+        def remove_listener():
+            self._stale_listeners.remove(update_callback)
+
+        return remove_listener
+
+    @callback
+    def async_add_release_listener(self, release_callback):
+        """Register a callback invoked when the pipeline is released, e.g. on reload."""
+        self._release_listeners.append(release_callback)
+
+        @callback
+        def remove_listener():
+            if release_callback in self._release_listeners:
+                self._release_listeners.remove(release_callback)
+
+        return remove_listener
+
+    @callback
+    def _async_handle_sample(self):
+        """Move the stale deadline ahead on a new input sample."""
+        self._stale_timer.async_refresh()
+        if not self.stale:
+            return
+
+        _LOGGER.debug(f"Input {self.input_stage.entity_ids} is reporting again")
+        self.stale = False
+        if self.stale_behavior == STALE_BEHAVIOR_DECAY and self.input_stage.available:
+            self.input_stage.async_stop_decay()
+        for update_callback in self._stale_listeners:
+            update_callback()
+
+    @callback
+    def _async_handle_stale(self, _timer):
+        """Apply the stale behavior once the input stopped reporting."""
+        _LOGGER.debug(
+            f"Input {self.input_stage.entity_ids} is stale, applying {self.stale_behavior}"
+        )
+        self.stale = True
+        if self.stale_behavior == STALE_BEHAVIOR_DECAY:
+            self.input_stage.async_start_decay()
+        for update_callback in self._stale_listeners:
+            update_callback()
+
+    @callback
+    def async_add_stage(self, name, stage_cls, upstream, **params):
+        """Acquire a shared stage of the given type below upstream."""
+        stage = self.manager.async_acquire(stage_cls, upstream, **params)
+        self.stages[name] = stage
+        return stage
+
+    @callback
+    def async_add_shadow(self, name, settings):
+        """Create an empty shadow pipeline, its stages publish no states."""
+        self.shadows[name] = {"settings": settings, "stages": {}, "comparison": None}
+
+    @callback
+    def async_add_shadow_stage(self, shadow, name, stage_cls, upstream, **params):
+        """Acquire a shared stage of the given type below upstream for a shadow pipeline.
+
+        Stages with the same settings as the live pipeline are shared with it,
+        so a shadow pipeline only costs the stages that actually differ.
+        """
+        stage = self.manager.async_acquire(stage_cls, upstream, **params)
+        self.shadows[shadow]["stages"][name] = stage
+        return stage
+
+    @callback
+    def async_compare_shadow(self, shadow, name):
+        """Compare the named stage of a shadow pipeline with that of the live one."""
+        comparison = ShadowComparison(
+            self.input_stage, self.stages[name], self.shadows[shadow]["stages"][name]
+        )
+        comparison.async_start()
+        self.shadows[shadow]["comparison"] = comparison
+
+    @callback
+    def async_release(self):
+        """Release every stage held by this pipeline, leaves first."""
+        for release_callback in list(self._release_listeners):
+            release_callback()
+        self._release_listeners = []
+
+        for shadow in self.shadows.values():
+            if shadow["comparison"] is not None:
+                shadow["comparison"].async_stop()
+            for stage in reversed(list(shadow["stages"].values())):
+                self.manager.async_release(stage)
+        self.shadows = {}
+
+        if self._stale_timer is not None:
+            self._stale_timer.async_cancel()
+            self._unsub_sample()
+            self._stale_timer = None
+
+        for stage in reversed(list(self.stages.values())):
+            self.manager.async_release(stage)
+        self.stages = {}
+
+
+class PipelineManager:
+    """Own every stage and deduplicate identical stages across config entries.
+
+    Stages are keyed by their type, parameters and upstream key, so two entries
+    on the same input with the same lowpass settings share one lowpass stage and
+    only branch where their settings differ.
+
+    The state of every stage is loaded from a single store once, before any
+    entry is set up, and restored as the stages are created.
+    """
+
+    def __init__(self, hass, cpu_budget=DEFAULT_CPU_BUDGET, memory_cap=None):
+        self.hass = hass
+        self.memory_cap = memory_cap
+        self.pipelines = {}
+        self.scheduler = LoadScheduler(hass, cpu_budget)
+        self.timer_wheel = TimerWheel(hass)
+        self._stages = {}
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._restore_data = {}
+        self._released_data = {}
+
+    async def async_load(self):
+        """Load the persisted state of every stage in one pass."""
+        self._restore_data = await self._store.async_load() or {}
+        _LOGGER.debug(f"Loaded the state of {len(self._restore_data)} stages")
+
+        # Periodic saving, load shedding and stale deadlines are not needed
+        # until Home Assistant has started
+        async_at_started(self.hass, self._async_start_saving)
+        async_at_started(self.hass, self.scheduler.async_start)
+        async_at_started(self.hass, self.timer_wheel.async_start)
+        self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_save)
+
+    async def _async_start_saving(self, hass):
+        """Save the state of every stage periodically."""
+        async_track_time_interval(hass, self._async_save, SAVE_INTERVAL)
+
+    async def _async_save(self, _event_or_now=None):
+        """Save the state of every stage."""
+        # Stages released during this run keep the state they had when released,
+        # stages of previous runs that were not created again are dropped
+        data = dict(self._released_data)
+        for key, stage in self._stages.items():
+            data[repr(key)] = stage.as_dict()
+        await self._store.async_save(data)
+
+    def memory_usage(self, exclude_entry_id=None):
+        """Return the approximate memory held by every stage, in bytes.
+
+        Stages only used by the pipeline of exclude_entry_id are left out.
+        """
+        exclude = self.pipelines.get(exclude_entry_id)
+        excluded = exclude.held_stages() if exclude is not None else {}
+        return sum(
+            stage.memory_usage()
+            for stage in self._stages.values()
+            if not (stage.refcount == 1 and stage.key in excluded)
+        )
+
+    def memory_budget(self, entry_cap, exclude_entry_id=None):
+        """Return the memory a pipeline may use under both caps in bytes, or None."""
+        budgets = []
+        if entry_cap:
+            budgets.append(entry_cap)
+        if self.memory_cap:
+            budgets.append(self.memory_cap - self.memory_usage(exclude_entry_id))
+        return min(budgets) if budgets else None
+
+    @callback
+    def async_create_pipeline(self, config_entry):
+        """Create the (still empty) pipeline of a config entry."""
+        pipeline = Pipeline(self, config_entry)
+        self.pipelines[config_entry.entry_id] = pipeline
+        return pipeline
+
+    @callback
+    def async_remove_pipeline(self, entry_id):
+        """Release the pipeline of a config entry."""
+        pipeline = self.pipelines.pop(entry_id, None)
+        if pipeline is not None:
+            pipeline.async_release()
+
+    @callback
+    def async_acquire_input(
+        self, entity_ids, aggregation, unavailable_behavior, stale_decay_timeout=0
+    ):
+        """Return the shared input stage of the input sensors, creating it if needed."""
+        key = input_stage_key(
+            entity_ids, aggregation, unavailable_behavior, stale_decay_timeout
+        )
+        _, entity_ids, aggregation = key[:3]
+        return self._async_acquire(
+            key,
+            lambda: InputStage(
+                key, self.hass, entity_ids, aggregation, unavailable_behavior
+            ),
+        )
+
+    @callback
+    def async_acquire(self, stage_cls, upstream, **params):
+        """Return the shared stage with these parameters below upstream."""
+        key = (stage_cls.stage_type, upstream.key, tuple(sorted(params.items())))
+        return self._async_acquire(key, lambda: stage_cls(key, upstream, **params))
+
+    @callback
+    def _async_acquire(self, key, factory):
+        """Look up a stage by key or create and wire it into the graph."""
+        stage = self._stages.get(key)
+        if stage is None:
+            stage = factory()
+            self._stages[key] = stage
+
+            # Restore the stage as it was when it was last saved or released
+            data = self._restore_data.get(repr(key))
+            if data is not None:
+                stage.from_dict(data)
+            if stage.upstream is not None:
+                stage.upstream.children.append(stage)
+            else:
+                stage.async_start()
+                self.scheduler.async_register(stage)
+            _LOGGER.debug(f"Created stage {key}")
+
+        stage.refcount += 1
+        return stage
+
+    @callback
+    def async_release(self, stage):
+        """Drop a reference to a stage and unwire it once nobody uses it."""
+        stage.refcount -= 1
+        if stage.refcount > 0:
+            return
+
+        if stage.upstream is not None:
+            stage.upstream.children.remove(stage)
+        else:
+            stage.async_stop()
+            self.scheduler.async_unregister(stage)
+        del self._stages[stage.key]
+
+        # Keep the state around in case the stage is created again, e.g. on reload
+        data = stage.as_dict()
+        self._restore_data[repr(stage.key)] = data
+        self._released_data[repr(stage.key)] = data
+        _LOGGER.debug(f"Removed stage {stage.key}")
@@ -0,0 +1,236 @@
+import heapq
+import logging
+import math
+import statistics
+from collections import deque
+from datetime import timedelta
+
+from homeassistant.components.recorder import get_instance, history
+from homeassistant.util import dt as dt_util
+
+from .custom_sensors.ema_sensor import calculate_alpha
+from .pipeline import INPUT_AGGREGATIONS
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    np = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# History the preview is computed from
+PREVIEW_HISTORY = timedelta(hours=24)
+MAX_PREVIEW_SAMPLES = 200000
+
+# Length of the synthetic step response, in seconds
+MAX_STEP_RESPONSE = 6 * 3600
+
+
+def fetch_history(hass, entity_ids, aggregation):
+    """Return the timestamps and (aggregated) values of the inputs over the preview history.
+
+    Runs in the executor.
+    """
+    end_time = dt_util.utcnow()
+    start_time = end_time - PREVIEW_HISTORY
+
+    # Merge the state changes of every input in time order
+    series = []
+    for entity_id in entity_ids:
+        # Let the recorder load only the latest states of a busy sensor
+        states = history.state_changes_during_period(
+            hass,
+            start_time,
+            end_time,
+            entity_id=entity_id,
+            no_attributes=True,
+            descending=True,
+            limit=MAX_PREVIEW_SAMPLES,
+            include_start_time_state=True,
+        ).get(entity_id, [])
+
+        samples = []
+        for state in states:
+            try:
+                samples.append(
+                    (state.last_updated.timestamp(), entity_id, float(state.state))
+                )
+            except ValueError:
+                continue
+
+        # The recorder returns the states newest first
+        samples.sort()
+        series.append(samples)
+
+    aggregate = INPUT_AGGREGATIONS.get(aggregation)
+    latest = {}
+    timestamps = []
+    values = []
+    for timestamp, entity_id, value in heapq.merge(*series):
+        latest[entity_id] = value
+        if len(latest) < len(entity_ids):
+            continue
+        timestamps.append(timestamp)
+        values.append(aggregate(latest.values()) if len(entity_ids) > 1 else value)
+
+    return timestamps[-MAX_PREVIEW_SAMPLES:], values[-MAX_PREVIEW_SAMPLES:]
+
+
+def run_pipeline(timestamps, values, settings):
+    """Run samples through the lowpass, median and EMA filters, return the EMA outputs.
+
+    The recursive filters run in a tight loop, the moving median is computed
+    over all windows at once when NumPy is available. Samples before the
+    median window is full have no output (None).
+    """
+    time_constant = settings["lowpass_time_constant"]
+    sampling_size = int(settings["median_sampling_size"])
+    desired_time_to_95 = settings["desired_time_to_95"]
+
+    # Lowpass
+    B = 1.0 / time_constant
+    A = 1.0 - B
+    lowpass = []
+    previous = None
+    for value in values:
+        previous = value if previous is None else A * previous + B * value
+        lowpass.append(previous)
+
+    # Moving median, available from the sample filling the window
+    if len(lowpass) < sampling_size:
+        return [None] * len(values)
+    if np is not None:
+        medians = np.median(
+            sliding_window_view(np.asarray(lowpass), sampling_size), axis=1
+        ).tolist()
+    else:
+        window = deque(lowpass[: sampling_size - 1], maxlen=sampling_size)
+        medians = []
+        for value in lowpass[sampling_size - 1 :]:
+            window.append(value)
+            medians.append(statistics.median(window))
+
+    # EMA with alpha recalculated for the interval of every sample
+    outputs = [None] * (sampling_size - 1)
+    previous = None
+    previous_timestamp = None
+    update_interval = 1
+    for timestamp, value in zip(timestamps[sampling_size - 1 :], medians):
+        if previous_timestamp is not None and timestamp > previous_timestamp:
+            update_interval = timestamp - previous_timestamp
+        previous_timestamp = timestamp
+
+        if previous is None:
+            previous = value
+        else:
+            alpha = calculate_alpha(desired_time_to_95, update_interval)
+            previous = alpha * value + (1 - alpha) * previous
+        outputs.append(previous)
+
+    return outputs
+
+
+def step_lag(settings, interval):
+    """Return the seconds until the output reaches 95% of a unit step, or None."""
+    warmup = int(settings["median_sampling_size"])
+    count = warmup + int(MAX_STEP_RESPONSE / interval)
+    timestamps = [index * interval for index in range(count)]
+    values = [0.0] * warmup + [1.0] * (count - warmup)
+
+    outputs = run_pipeline(timestamps, values, settings)
+    for index in range(warmup, count):
+        if outputs[index] is not None and outputs[index] >= 0.95:
+            return timestamps[index] - timestamps[warmup]
+    return None
+
+
+def spike_attenuation(settings, interval):
+    """Return the fraction of a single-sample spike that is removed by the filters."""
+    warmup = int(settings["median_sampling_size"])
+    count = 2 * warmup + int(MAX_STEP_RESPONSE / interval / 10)
+    timestamps = [index * interval for index in range(count)]
+    values = [0.0] * count
+    values[warmup] = 1.0
+
+    outputs = run_pipeline(timestamps, values, settings)
+    return 1.0 - max(output or 0.0 for output in outputs)
+
+
+def _pstdev(data):
+    """Return the population standard deviation in floating point.
+
+    statistics.pstdev is exact, but far too slow for a day of samples.
+    """
+    mean = sum(data) / len(data)
+    return math.sqrt(sum((value - mean) ** 2 for value in data) / len(data))
+
+
+def noise_reduction(values, outputs):
+    """Return the fraction of the sample-to-sample noise of the input removed by the filters."""
+    pairs = [
+        (value, output) for value, output in zip(values, outputs) if output is not None
+    ]
+    if len(pairs) < 3:
+        return None
+
+    input_noise = _pstdev([b[0] - a[0] for a, b in zip(pairs, pairs[1:])])
+    output_noise = _pstdev([b[1] - a[1] for a, b in zip(pairs, pairs[1:])])
+    if not input_noise:
+        return None
+    return 1.0 - output_noise / input_noise
+
+
+def sample_interval(timestamps):
+    """Return the median interval between the samples in seconds."""
+    intervals = [b - a for a, b in zip(timestamps, timestamps[1:]) if b > a]
+    return max(statistics.median(intervals), 0.1) if intervals else 1.0
+
+
+def response_metrics(timestamps, values, settings):
+    """Return the lag, spike attenuation and noise reduction of the settings.
+
+    Runs in the executor.
+    """
+    interval = sample_interval(timestamps)
+    return {
+        "lag_to_95": step_lag(settings, interval),
+        "spike_attenuation": spike_attenuation(settings, interval),
+        "noise_reduction": noise_reduction(
+            values, run_pipeline(timestamps, values, settings)
+        ),
+    }
+
+
+def format_metrics(timestamps, current, proposed):
+    """Return the metrics of both settings as a markdown table for the options form."""
+
+    def seconds(value):
+        return "-" if value is None else f"{value:.0f} s"
+
+    def percent(value):
+        return "-" if value is None else f"{value:.0%}"
+
+    return "\n".join(
+        [
+            f"Based on {len(timestamps)} samples of the last "
+            f"{PREVIEW_HISTORY.total_seconds() / 3600:.0f} hours, "
+            f"{sample_interval(timestamps):.1f} s apart.",
+            "",
+            "| | Current | Proposed |",
+            "|---|---|---|",
+            f"| Lag to 95% of a step | {seconds(current['lag_to_95'])} "
+            f"| {seconds(proposed['lag_to_95'])} |",
+            f"| Spike attenuation | {percent(current['spike_attenuation'])} "
+            f"| {percent(proposed['spike_attenuation'])} |",
+            f"| Noise reduction | {percent(current['noise_reduction'])} "
+            f"| {percent(proposed['noise_reduction'])} |",
+        ]
+    )
+
+
+async def async_fetch_history(hass, entity_ids, aggregation):
+    """Fetch the preview history of the inputs from the recorder."""
+    return await get_instance(hass).async_add_executor_job(
+        fetch_history, hass, entity_ids, aggregation
+    )
@@ -0,0 +1,156 @@
+import contextlib
+import logging
+import mmap
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# Header: magic, capacity, index of the next record, number of records
+HEADER = struct.Struct("<8sQQQ")
+MAGIC = b"SASLOG01"
+
+# Record: timestamp (seconds since the epoch) and value
+RECORD = struct.Struct("<dd")
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([("timestamp", "<f8"), ("value", "<f8")])
+
+
+class SampleLog:
+    """Append-only, fixed-size ring of (timestamp, value) samples in a memory-mapped file.
+
+    Appending is a struct.pack_into on the mapping, so it is cheap enough for
+    the event loop. Opening and closing touch the disk and belong in the executor.
+    Tools reading an existing log can leave the capacity out to take it from
+    the file.
+    """
+
+    def __init__(self, path, capacity=None):
+        self.path = path
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+        self._file = None
+        self._mmap = None
+
+    @staticmethod
+    def remove(path):
+        """Delete the file of a log, if there is one."""
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+    @staticmethod
+    def estimate_memory(capacity):
+        """Return the size of a log with the given capacity in bytes."""
+        return HEADER.size + RECORD.size * capacity if capacity else 0
+
+    @property
+    def size(self):
+        """Return the size of the file in bytes."""
+        return self.estimate_memory(self.capacity)
+
+    def open(self):
+        """Open the log, creating it or starting it over if the capacity changed."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        if self.capacity is None:
+            with open(self.path, "rb") as file:
+                self.capacity = HEADER.unpack(file.read(HEADER.size))[1]
+
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) == self.size
+        self._file = open(self.path, "r+b" if exists else "w+b")
+        if not exists:
+            self._file.truncate(self.size)
+        self._mmap = mmap.mmap(self._file.fileno(), self.size)
+
+        magic, capacity, head, count = HEADER.unpack_from(self._mmap, 0)
+        if magic == MAGIC and capacity == self.capacity and count <= capacity:
+            self.head = head
+            self.count = count
+        else:
+            self.head = 0
+            self.count = 0
+            self._write_header()
+
+        _LOGGER.debug(f"Opened sample log {self.path} with {self.count} samples")
+
+    def close(self):
+        """Flush and close the log."""
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def resize(self, capacity):
+        """Reopen the log with another capacity, keeping the newest samples."""
+        samples = self.read(capacity)
+        self.close()
+        self.capacity = capacity
+        self.open()
+        for timestamp, value in samples:
+            self.append(timestamp, value)
+
+    def append(self, timestamp, value):
+        """Append a sample, overwriting the oldest one when the log is full."""
+        RECORD.pack_into(
+            self._mmap, HEADER.size + RECORD.size * self.head, timestamp, value
+        )
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self._write_header()
+
+    def read(self, limit=None):
+        """Return up to limit of the newest samples as (timestamp, value), oldest first."""
+        count = self.count if limit is None else min(limit, self.count)
+        samples = []
+        for start, end in self._segments(count):
+            offset = HEADER.size + RECORD.size * start
+            length = RECORD.size * (end - start)
+            samples.extend(RECORD.iter_unpack(self._mmap[offset : offset + length]))
+        return samples
+
+    def as_arrays(self, limit=None):
+        """Return zero-copy NumPy views of the newest samples, oldest first.
+
+        The ring may wrap, so a list of up to two structured arrays with
+        timestamp and value fields is returned. The log cannot be closed while
+        the arrays are still referenced.
+        """
+        if np is None:
+            raise RuntimeError("NumPy is not available")
+
+        count = self.count if limit is None else min(limit, self.count)
+        return [
+            np.frombuffer(
+                self._mmap,
+                dtype=RECORD_DTYPE,
+                count=end - start,
+                offset=HEADER.size + RECORD.size * start,
+            )
+            for start, end in self._segments(count)
+        ]
+
+    def _segments(self, count):
+        """Return the record index ranges holding the newest count samples, oldest first."""
+        if count == 0:
+            return []
+
+        start = (self.head - count) % self.capacity
+        if start < self.head:
+            return [(start, self.head)]
+        if self.head == 0:
+            return [(start, self.capacity)]
+        return [(start, self.capacity), (0, self.head)]
+
+    def _write_header(self):
+        """Write the header to the mapping."""
+        HEADER.pack_into(self._mmap, 0, MAGIC, self.capacity, self.head, self.count)
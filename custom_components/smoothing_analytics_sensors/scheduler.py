@@ -0,0 +1,178 @@
+import logging
+from datetime import timedelta
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import (
+    LOAD_LEVEL_COALESCE,
+    LOAD_LEVEL_NORMAL,
+    LOAD_LEVEL_THROTTLE_PUBLISH,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Coalesced inputs are pushed through their pipeline once per tick
+TICK_INTERVAL = timedelta(seconds=1)
+
+# The CPU time is compared against the budget once per window of ticks
+WINDOW_TICKS = 10
+
+# Degraded inputs step back one level after this many windows well below budget
+RECOVERY_WINDOWS = 3
+RECOVERY_RATIO = 0.5
+
+
+class LoadScheduler:
+    """Keep the time spent in smoothing callbacks within a CPU budget.
+
+    Every input stage reports the time spent handling its events, including
+    the filters and state writes below it. When a window exceeds the budget,
+    the input that used the most time is degraded one level: first its events
+    are decimated, then coalesced to one per tick, and finally its sensors
+    publish at a lower rate. Once the load stays well below the budget, the
+    degraded inputs recover one level at a time.
+    """
+
+    def __init__(self, hass, cpu_budget):
+        self.hass = hass
+        self.cpu_budget = cpu_budget
+        self.window_usage = 0.0
+        self._budget = cpu_budget / 100
+        self._stages = {}
+        self._ticks = 0
+        self._calm_windows = 0
+        self._unsub = None
+
+    @property
+    def window_seconds(self):
+        """Return the length of an accounting window in seconds."""
+        return WINDOW_TICKS * TICK_INTERVAL.total_seconds()
+
+    @callback
+    def async_register(self, stage):
+        """Start accounting the time spent by an input stage."""
+        self._stages[stage.key] = stage
+
+    @callback
+    def async_unregister(self, stage):
+        """Stop accounting the time spent by an input stage."""
+        self._stages.pop(stage.key, None)
+
+    @callback
+    def async_start(self, _hass=None):
+        """Start ticking."""
+        self._unsub = async_track_time_interval(
+            self.hass, self._async_tick, TICK_INTERVAL
+        )
+
+    @callback
+    def async_stop(self):
+        """Stop ticking."""
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def _async_tick(self, _now):
+        """Flush coalesced inputs and compare the window against the budget."""
+        for stage in list(self._stages.values()):
+            if stage.load_level >= LOAD_LEVEL_COALESCE:
+                stage.async_flush_pending()
+
+        self._ticks += 1
+        if self._ticks < WINDOW_TICKS:
+            return
+        self._ticks = 0
+
+        for stage in self._stages.values():
+            stage.load_stats.async_close_window()
+
+        busy = sum(stage.load_stats.window_busy for stage in self._stages.values())
+        self.window_usage = busy / self.window_seconds
+
+        if self.window_usage > self._budget:
+            self._calm_windows = 0
+            self._async_degrade()
+        elif self.window_usage < self._budget * RECOVERY_RATIO:
+            self._calm_windows += 1
+            if self._calm_windows >= RECOVERY_WINDOWS:
+                self._calm_windows = 0
+                self._async_recover()
+
+    @callback
+    def _async_degrade(self):
+        """Degrade the input that used the most time in the last window."""
+        candidates = [
+            stage
+            for stage in self._stages.values()
+            if stage.load_level < LOAD_LEVEL_THROTTLE_PUBLISH
+        ]
+        if not candidates:
+            return
+
+        stage = max(candidates, key=lambda stage: stage.load_stats.window_busy)
+        stage.load_level += 1
+        _LOGGER.warning(
+            f"Smoothing used {self.window_usage:.1%} of the event loop, over the budget of {self._budget:.1%}. "
+            f"Degrading {stage.entity_ids} to load level {stage.load_level}"
+        )
+
+    @callback
+    def _async_recover(self):
+        """Step every degraded input back one level."""
+        for stage in self._stages.values():
+            if stage.load_level == LOAD_LEVEL_NORMAL:
+                continue
+
+            # Push out what was coalesced before going back to decimation
+            if stage.load_level == LOAD_LEVEL_COALESCE:
+                stage.async_flush_pending()
+
+            stage.load_level -= 1
+            _LOGGER.info(
+                f"Recovering {stage.entity_ids} to load level {stage.load_level}"
+            )
+
+    def as_dict(self):
+        """Return the state of the scheduler for diagnostics."""
+        return {
+            "cpu_budget": self.cpu_budget,
+            "window_usage": self.window_usage * 100,
+            "degraded_inputs": {
+                repr(stage.key): stage.load_level
+                for stage in self._stages.values()
+                if stage.load_level != LOAD_LEVEL_NORMAL
+            },
+        }
+
+
+class LoadStats:
+    """Events and CPU time of an input stage per accounting window."""
+
+    def __init__(self):
+        self.events = 0
+        self.busy = 0.0
+        self.window_events = 0
+        self.window_busy = 0.0
+
+    @callback
+    def async_record(self, elapsed, events=1):
+        """Account events that took elapsed seconds to handle."""
+        self.events += events
+        self.busy += elapsed
+
+    @callback
+    def async_close_window(self):
+        """Keep the totals of the last window and start a new one."""
+        self.window_events = self.events
+        self.window_busy = self.busy
+        self.events = 0
+        self.busy = 0.0
+
+    def as_dict(self, window_seconds):
+        """Return the load of the last window for diagnostics."""
+        return {
+            "events_per_second": self.window_events / window_seconds,
+            "cpu_time_per_second": self.window_busy / window_seconds,
+        }
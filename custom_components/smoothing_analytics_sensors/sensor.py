@@ -1,69 +1,54 @@
 import logging
 
-from .const import (
-    DEFAULT_EMA_DESIRED_TIME_TO_95,
-    DEFAULT_LOW_PASS,
-    DEFAULT_MEDIAN_SIZE,
-    DOMAIN,
-)
-from .custom_sensors.ema_sensor import EmaSensor
+from .const import DOMAIN
+from .custom_sensors.ema_sensor import EmaHorizonSensor, EmaSensor
+from .custom_sensors.fir_sensor import FirSensor
+from .custom_sensors.hampel_sensor import HampelSensor
+from .custom_sensors.holt_sensor import HoltPredictionSensor, HoltSensor
+from .custom_sensors.integration_sensor import IntegrationSensor
 from .custom_sensors.lowpass_sensor import LowpassSensor
 from .custom_sensors.median_sensor import MedianSensor
-from .utils.misc import generate_md5_hash, get_config_value
+from .custom_sensors.slope_sensor import SlopeSensor
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Set up Smoothing Analytics sensors from a config entry."""
-    config = config_entry.data
+    pipeline = hass.data[DOMAIN].pipelines[config_entry.entry_id]
 
-    # Extract configuration parameters
-    input_sensor = config.get("input_sensor")
+    # Publish the output of every stage of the pipeline
+    sensors = [LowpassSensor(pipeline, pipeline.stages["lowpass"])]
 
-    lowpass_time_constant = get_config_value(
-        config_entry, "lowpass_time_constant", DEFAULT_LOW_PASS
-    )
+    # The Hampel stage comes before the median stage, or replaces it
+    if "hampel" in pipeline.stages:
+        sensors.append(HampelSensor(pipeline, pipeline.stages["hampel"]))
+    if "median" in pipeline.stages:
+        sensors.append(MedianSensor(pipeline, pipeline.stages["median"]))
 
-    median_sampling_size = get_config_value(
-        config_entry, "median_sampling_size", DEFAULT_MEDIAN_SIZE
-    )
+    sensors.append(EmaSensor(pipeline, pipeline.stages["ema"]))
 
-    desired_time_to_95 = get_config_value(
-        config_entry, "desired_time_to_95", DEFAULT_EMA_DESIRED_TIME_TO_95
+    # Additional EMA horizons computed by the same stage
+    ema_stage = pipeline.stages["ema"]
+    sensors.extend(
+        EmaHorizonSensor(pipeline, ema_stage, index)
+        for index in range(1, len(ema_stage.horizons))
     )
 
-    # Generate a unique hash based on the input sensor
-    sensor_hash = generate_md5_hash(input_sensor)
+    if "holt" in pipeline.stages:
+        holt_stage = pipeline.stages["holt"]
+        sensors.append(HoltSensor(pipeline, holt_stage))
+        if holt_stage.prediction_horizon:
+            sensors.append(HoltPredictionSensor(pipeline, holt_stage))
 
-    # Unique input IDs for median and EMA sensors for stacking purposes
-    median_unique_id = f"sas_lowpass_{sensor_hash}"
-    ema_unique_id = f"sas_median_{sensor_hash}"
-
-    # Create the lowpass from the input sensor
-    lowpass_sensor = LowpassSensor(
-        input_sensor, lowpass_time_constant, sensor_hash, config_entry
-    )
+    if "fir" in pipeline.stages:
+        sensors.append(FirSensor(pipeline, pipeline.stages["fir"]))
 
-    # Create the median, and ema sensors using the unique IDs
-    median_sensor = MedianSensor(
-        median_unique_id, median_sampling_size, sensor_hash, config_entry
-    )
+    if "slope" in pipeline.stages:
+        sensors.append(SlopeSensor(pipeline, pipeline.stages["slope"]))
 
-    ema_sensor = EmaSensor(ema_unique_id, desired_time_to_95, sensor_hash, config_entry)
+    if "integration" in pipeline.stages:
+        sensors.append(IntegrationSensor(pipeline, pipeline.stages["integration"]))
 
     # Add sensors to Home Assistant
-    async_add_entities([lowpass_sensor, median_sensor, ema_sensor])
-
-    # Store reference to the platform to handle unloads later
-    if DOMAIN not in hass.data:
-        hass.data[DOMAIN] = {}
-    hass.data[DOMAIN][config_entry.entry_id] = async_add_entities
-
-
-async def async_unload_entry(hass, entry):
-    """Handle unloading of an entry."""
-    platform = hass.data[DOMAIN].get(entry.entry_id)
-    if platform:
-        return await platform.async_remove_entry(entry)
-    return False
+    async_add_entities(sensors)
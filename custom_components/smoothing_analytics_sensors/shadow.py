@@ -0,0 +1,132 @@
+import logging
+import math
+
+from homeassistant.core import callback
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ShadowComparison:
+    """Running comparison of a shadow pipeline with the live one, in O(1) per sample.
+
+    Both pipelines run off the same input stage. When the input takes a new
+    sample, the outputs of both pipelines still belong to the previous one, so
+    that sample is compared before the new one is pushed through the stages.
+
+    The lag of an output y behind the input x is estimated by least squares
+    from x - y = lag * dy/dt, which holds for signals that change slowly
+    compared to the lag.
+    """
+
+    def __init__(self, input_stage, live_stage, shadow_stage):
+        self.input_stage = input_stage
+        self.live_stage = live_stage
+        self.shadow_stage = shadow_stage
+        self.samples = 0
+        self.max_divergence = 0.0
+        self._sums = dict.fromkeys(
+            (
+                "divergence",
+                "divergence_squared",
+                "input_step_squared",
+                "live_step_squared",
+                "shadow_step_squared",
+                "live_lag",
+                "live_rate_squared",
+                "shadow_lag",
+                "shadow_rate_squared",
+            ),
+            0.0,
+        )
+        self._sample = None
+        self._previous = None
+        self._unsub = None
+
+    @callback
+    def async_start(self):
+        """Start comparing the outputs on every input sample."""
+        self._unsub = self.input_stage.async_add_listener(self._async_handle_input)
+
+    @callback
+    def async_stop(self):
+        """Stop comparing the outputs."""
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def _async_handle_input(self):
+        """Compare the outputs of both pipelines for the previous input sample."""
+        sample = self._sample
+        self._sample = (self.input_stage.last_updated, self.input_stage.value)
+
+        # Start over after a reset, or while a pipeline has no output yet
+        live = self.live_stage.value
+        shadow = self.shadow_stage.value
+        if sample is None or sample[1] is None or live is None or shadow is None:
+            self._previous = None
+            return
+
+        timestamp, value = sample
+        previous = self._previous
+        self._previous = (timestamp, value, live, shadow)
+        if previous is None:
+            return
+
+        interval = (timestamp - previous[0]).total_seconds()
+        if interval <= 0:
+            return
+
+        sums = self._sums
+        divergence = abs(live - shadow)
+        self.samples += 1
+        self.max_divergence = max(self.max_divergence, divergence)
+        sums["divergence"] += divergence
+        sums["divergence_squared"] += divergence**2
+        sums["input_step_squared"] += (value - previous[1]) ** 2
+
+        for name, output, previous_output in (
+            ("live", live, previous[2]),
+            ("shadow", shadow, previous[3]),
+        ):
+            step = output - previous_output
+            rate = step / interval
+            sums[f"{name}_step_squared"] += step**2
+            sums[f"{name}_lag"] += (value - output) * rate
+            sums[f"{name}_rate_squared"] += rate**2
+
+    def _residual_noise(self, name):
+        """Return the sample-to-sample noise of an output relative to the input."""
+        if not self._sums["input_step_squared"]:
+            return None
+        return math.sqrt(
+            self._sums[f"{name}_step_squared"] / self._sums["input_step_squared"]
+        )
+
+    def _lag(self, name):
+        """Return the least-squares lag of an output behind the input in seconds."""
+        if not self._sums[f"{name}_rate_squared"]:
+            return None
+        return self._sums[f"{name}_lag"] / self._sums[f"{name}_rate_squared"]
+
+    def as_dict(self):
+        """Return the comparison metrics accumulated so far."""
+        if not self.samples:
+            return {"samples": 0}
+
+        return {
+            "samples": self.samples,
+            "divergence": {
+                "mean_absolute": self._sums["divergence"] / self.samples,
+                "rms": math.sqrt(self._sums["divergence_squared"] / self.samples),
+                "max": self.max_divergence,
+            },
+            "live": {
+                "lag": self._lag("live"),
+                "residual_noise": self._residual_noise("live"),
+            },
+            "shadow": {
+                "lag": self._lag("shadow"),
+                "residual_noise": self._residual_noise("shadow"),
+            },
+        }
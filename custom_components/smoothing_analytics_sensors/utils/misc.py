@@ -1,10 +1,6 @@
 import hashlib
 import logging
 
-from homeassistant.helpers import entity_registry as er
-
-from ..const import DOMAIN
-
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -18,28 +14,38 @@ def get_config_value(config_entry, key, default_value=None):
     return config_entry.options.get(key, config_entry.data.get(key, default_value))
 
 
-async def async_resolve_entity_id_from_unique_id(
-    self, unique_entity_id, domain="sensor"
-):
-    """
-    Resolve the entity_id from the unique_id using the entity registry.
+def parse_horizons(value):
+    """Parse a comma-separated list of horizons in seconds into a sorted tuple."""
+    if not value:
+        return ()
+
+    horizons = sorted({float(part) for part in str(value).split(",") if part.strip()})
+    if any(horizon < 1 for horizon in horizons):
+        raise ValueError(f"Horizons must be at least 1 second: {value}")
+    return tuple(horizons)
+
+
+def parse_shadow_pipelines(value, settings):
+    """Parse semicolon-separated shadow pipelines of comma-separated key=value overrides.
 
-    :param unique_entity_id: Unique ID of the entity to resolve.
-    :param domain: The domain of the entity (e.g., 'sensor').
-    :return: The resolved entity_id or None if not found.
+    Return a tuple with a dict of overrides per shadow pipeline, raise
+    ValueError on unknown settings and values below 1.
     """
-    # Get the entity registry
-    registry = er.async_get(self.hass)
-
-    # Fetch the entity_id from the unique_id
-    entry = registry.async_get_entity_id(domain, DOMAIN, unique_entity_id)
-
-    # Log the resolved entity_id for debugging purposes
-    if entry:
-        _LOGGER.debug(f"Resolved entity_id for unique_id {unique_entity_id}: {entry}")
-        return entry
-    else:
-        _LOGGER.warning(
-            f"Entity with unique_id {unique_entity_id} not found in registry."
-        )
-        return None
+    shadows = []
+    for part in str(value or "").split(";"):
+        if not part.strip():
+            continue
+
+        overrides = {}
+        for item in part.split(","):
+            if not item.strip():
+                continue
+            key, separator, number = item.partition("=")
+            key = key.strip()
+            if not separator or key not in settings:
+                raise ValueError(f"Unknown shadow pipeline setting: {item.strip()}")
+            overrides[key] = float(number)
+            if overrides[key] < 1:
+                raise ValueError(f"Shadow pipeline settings must be at least 1: {item}")
+        shadows.append(overrides)
+    return tuple(shadows)
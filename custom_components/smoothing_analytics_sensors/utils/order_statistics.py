@@ -0,0 +1,98 @@
+import bisect
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SortedWindow:
+    """The values of a sliding window kept in sorted order, with access by rank.
+
+    Values are placed by binary search, so a value costs O(log n) comparisons
+    plus moving the values after it. In CPython that move is a single memmove,
+    which is far cheaper than following the links of a tree or skiplist in
+    Python for any realistic window, and ranks are plain list indexes.
+    """
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values=()):
+        self._values = sorted(values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, rank):
+        """Return the value at the rank, counted from the smallest value."""
+        return self._values[rank]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def insert(self, value):
+        """Insert a value after any equal values."""
+        bisect.insort(self._values, value)
+
+    def remove(self, value):
+        """Remove one occurrence of a value, raise ValueError if it is missing."""
+        index = bisect.bisect_left(self._values, value)
+        if index == len(self._values) or self._values[index] != value:
+            raise ValueError(f"Value {value} not in window")
+        del self._values[index]
+
+    def clear(self):
+        """Remove every value."""
+        self._values.clear()
+
+
+def select_merged(first, first_size, second, second_size, rank):
+    """Return the value at the rank in the merge of two sorted sequences.
+
+    first(index) and second(index) return the values of the sequences, which
+    are only accessed O(log n) times by a binary search for the number of
+    values taken from the first sequence.
+    """
+    low = max(0, rank + 1 - second_size)
+    high = min(rank + 1, first_size)
+    while low < high:
+        taken = (low + high) // 2
+        if first(taken) < second(rank - taken):
+            low = taken + 1
+        else:
+            high = taken
+
+    candidates = []
+    if low > 0:
+        candidates.append(first(low - 1))
+    if rank - low >= 0:
+        candidates.append(second(rank - low))
+    return max(candidates)
+
+
+def median_absolute_deviation(ordered):
+    """Return the median and the median absolute deviation of a sorted sequence.
+
+    The absolute deviations of the values below and above the median are two
+    sorted sequences, read outwards from the median, so the median of all
+    deviations is selected from their merge in O(log n) accesses of ordered.
+    """
+    size = len(ordered)
+    split = (size + 1) // 2
+    if size % 2:
+        median = ordered[split - 1]
+    else:
+        median = (ordered[split - 1] + ordered[split]) / 2
+
+    def below(index):
+        return median - ordered[split - 1 - index]
+
+    def above(index):
+        return ordered[split + index] - median
+
+    def select(rank):
+        return select_merged(below, split, above, size - split, rank)
+
+    if size % 2:
+        deviation = select(size // 2)
+    else:
+        deviation = (select(size // 2 - 1) + select(size // 2)) / 2
+    return median, deviation
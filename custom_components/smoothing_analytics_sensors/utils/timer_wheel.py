@@ -0,0 +1,121 @@
+import logging
+import time
+from datetime import timedelta
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_interval
+
+_LOGGER = logging.getLogger(__name__)
+
+# Resolution of the wheel, deadlines expire at most one tick late
+TICK_INTERVAL = timedelta(seconds=1)
+
+# Number of slots, deadlines further ahead go around the wheel again
+WHEEL_SLOTS = 64
+
+
+class WheelTimer:
+    """A deadline on the timer wheel, refreshed far more often than it expires."""
+
+    __slots__ = ("wheel", "timeout", "expire_callback", "deadline", "expired", "_slot")
+
+    def __init__(self, wheel, timeout, expire_callback):
+        self.wheel = wheel
+        self.timeout = timeout
+        self.expire_callback = expire_callback
+        self.deadline = None
+        self.expired = False
+        self._slot = None
+
+    @callback
+    def async_refresh(self):
+        """Move the deadline timeout seconds ahead.
+
+        Only the deadline is updated, the timer is moved to its new slot when
+        the wheel reaches the old one.
+        """
+        self.deadline = time.monotonic() + self.timeout
+        self.expired = False
+        if self._slot is None:
+            self.wheel.async_insert(self)
+
+    @callback
+    def async_cancel(self):
+        """Cancel the timer, it is dropped when the wheel reaches its slot."""
+        self.deadline = None
+
+
+class TimerWheel:
+    """Hashed timer wheel shared by the deadlines of every pipeline.
+
+    Refreshing a deadline is an attribute assignment, and one tick per second
+    only looks at the timers in the current slot. Timers whose deadline moved
+    on in the meantime are put back into the slot of their new deadline.
+    """
+
+    def __init__(self, hass, slots=WHEEL_SLOTS):
+        self.hass = hass
+        self._tick = TICK_INTERVAL.total_seconds()
+        self._slots = [set() for _ in range(slots)]
+        self._cursor = self._tick_of(time.monotonic())
+        self._unsub = None
+
+    def _tick_of(self, deadline):
+        """Return the tick a deadline expires in."""
+        return int(deadline // self._tick)
+
+    @callback
+    def async_create_timer(self, timeout, expire_callback):
+        """Create a timer calling expire_callback once its deadline passes."""
+        return WheelTimer(self, timeout, expire_callback)
+
+    @callback
+    def async_insert(self, timer):
+        """Put a timer into the slot of its deadline."""
+        # Deadlines already passed are handled on the next tick
+        tick = max(self._tick_of(timer.deadline), self._cursor + 1)
+        timer._slot = tick % len(self._slots)
+        self._slots[timer._slot].add(timer)
+
+    @callback
+    def async_start(self, _hass=None):
+        """Start ticking."""
+        self._cursor = self._tick_of(time.monotonic())
+        self._unsub = async_track_time_interval(
+            self.hass, self._async_tick, TICK_INTERVAL
+        )
+
+    @callback
+    def async_stop(self):
+        """Stop ticking."""
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def _async_tick(self, _now):
+        """Expire the timers of every slot passed since the previous tick."""
+        now = time.monotonic()
+        current = self._tick_of(now)
+
+        # Catch up on late ticks, but never go around the wheel more than once
+        ticks = min(current - self._cursor, len(self._slots))
+        self._cursor = current
+        for tick in range(current - ticks + 1, current + 1):
+            slot = self._slots[tick % len(self._slots)]
+            if not slot:
+                continue
+
+            timers = list(slot)
+            slot.clear()
+            for timer in timers:
+                timer._slot = None
+                if timer.deadline is None:
+                    continue
+                if timer.deadline > now:
+                    self.async_insert(timer)
+                    continue
+
+                timer.deadline = None
+                timer.expired = True
+                timer.expire_callback(timer)
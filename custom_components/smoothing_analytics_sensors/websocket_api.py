@@ -0,0 +1,152 @@
+import logging
+
+import voluptuous as vol
+from homeassistant.components import websocket_api
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# Send a batch right away once it holds this many samples
+MAX_BATCH_SIZE = 1000
+
+
+@callback
+def async_setup(hass):
+    """Register the websocket commands."""
+    websocket_api.async_register_command(hass, websocket_subscribe)
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/subscribe",
+        vol.Required("entry_id"): str,
+        vol.Optional("stages"): [str],
+        vol.Optional("decimation", default=1): vol.All(int, vol.Range(min=1)),
+        vol.Optional("batch_interval", default=1.0): vol.All(
+            vol.Coerce(float), vol.Range(min=0.05, max=60)
+        ),
+    }
+)
+@callback
+def websocket_subscribe(hass, connection, msg):
+    """Subscribe to the output of the stages of a pipeline at full input rate."""
+    pipeline = hass.data[DOMAIN].pipelines.get(msg["entry_id"])
+    if pipeline is None:
+        connection.send_error(
+            msg["id"], websocket_api.ERR_NOT_FOUND, "Pipeline not found"
+        )
+        return
+
+    stage_names = msg.get("stages") or list(pipeline.stages)
+    unknown = [name for name in stage_names if name not in pipeline.stages]
+    if unknown:
+        connection.send_error(
+            msg["id"], websocket_api.ERR_INVALID_FORMAT, f"Unknown stages: {unknown}"
+        )
+        return
+
+    stream = StageStream(
+        hass,
+        connection,
+        msg["id"],
+        pipeline,
+        {name: pipeline.stages[name] for name in stage_names},
+        msg["decimation"],
+        msg["batch_interval"],
+    )
+    connection.subscriptions[msg["id"]] = stream.async_stop
+    connection.send_result(msg["id"])
+
+
+class StageStream:
+    """Stream the outputs of pipeline stages to a websocket connection in batches.
+
+    Every message holds the samples since the previous one, per stage, as
+    compact [timestamp, value] pairs. No state is written for them. The
+    subscription ends with an error when the pipeline is released, e.g. when
+    the entry reloads after an options change, as its stages are gone.
+    """
+
+    def __init__(
+        self, hass, connection, msg_id, pipeline, stages, decimation, batch_interval
+    ):
+        self.hass = hass
+        self.connection = connection
+        self.msg_id = msg_id
+        self.decimation = decimation
+        self.batch_interval = batch_interval
+        self._batch = {name: [] for name in stages}
+        self._batch_size = 0
+        self._counters = dict.fromkeys(stages, 0)
+        self._unsub_flush = None
+        self._unsubs = [
+            stage.async_add_listener(self._make_listener(name, stage))
+            for name, stage in stages.items()
+        ]
+        self._unsubs.append(
+            pipeline.async_add_release_listener(self._async_handle_release)
+        )
+
+    def _make_listener(self, name, stage):
+        """Return the listener collecting the samples of a stage."""
+
+        @callback
+        def _handle_stage_update():
+            self._counters[name] += 1
+            if self._counters[name] < self.decimation:
+                return
+            self._counters[name] = 0
+
+            timestamp = stage.last_updated.timestamp() if stage.last_updated else None
+            self._batch[name].append((timestamp, stage.value))
+            self._batch_size += 1
+
+            if self._batch_size >= MAX_BATCH_SIZE:
+                self._async_flush()
+            elif self._unsub_flush is None:
+                self._unsub_flush = async_call_later(
+                    self.hass, self.batch_interval, self._async_flush
+                )
+
+        return _handle_stage_update
+
+    @callback
+    def _async_flush(self, _now=None):
+        """Send the collected samples."""
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
+
+        batch = {name: samples for name, samples in self._batch.items() if samples}
+        self._batch = {name: [] for name in self._batch}
+        self._batch_size = 0
+
+        if batch:
+            self.connection.send_message(
+                websocket_api.event_message(self.msg_id, {"stages": batch})
+            )
+
+    @callback
+    def _async_handle_release(self):
+        """Send the remaining samples and end the subscription."""
+        self._async_flush()
+        self.async_stop()
+        self.connection.subscriptions.pop(self.msg_id, None)
+        self.connection.send_error(
+            self.msg_id,
+            websocket_api.ERR_NOT_FOUND,
+            "Pipeline removed, e.g. reloaded after an options change",
+        )
+
+    @callback
+    def async_stop(self):
+        """Stop streaming."""
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs = []
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
@@ -0,0 +1 @@
+"""Tests for the Smoothing Analytics Sensors integration."""
@@ -0,0 +1,15 @@
+"""Fixtures for the Smoothing Analytics Sensors tests."""
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Load the integration from custom_components in every test."""
+    yield
+
+
+@pytest.fixture
+def expected_lingering_timers():
+    """Allow the timers of the pipeline manager, which lives as long as hass."""
+    return True
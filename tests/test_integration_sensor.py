@@ -0,0 +1,60 @@
+"""Tests for the integration sensor and its stage."""
+
+from datetime import datetime, timedelta, timezone
+
+from homeassistant.helpers import entity_registry as er
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.smoothing_analytics_sensors.const import (
+    DOMAIN,
+    INTEGRATION_METHOD_TRAPEZOIDAL,
+)
+from custom_components.smoothing_analytics_sensors.custom_sensors.integration_sensor import (
+    IntegrationStage,
+)
+
+
+async def test_integration_sensor_is_a_total_increasing_energy_sensor(hass):
+    """The integration of a power sensor is published as an energy meter."""
+    hass.states.async_set(
+        "sensor.power", "100", {"unit_of_measurement": "W", "device_class": "power"}
+    )
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        version=3,
+        data={
+            "input_sensor": ["sensor.power"],
+            "integration_method": INTEGRATION_METHOD_TRAPEZOIDAL,
+        },
+    )
+    entry.add_to_hass(hass)
+
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    entity_id = er.async_get(hass).async_get_entity_id(
+        "sensor", DOMAIN, f"sas_integration_{entry.entry_id}"
+    )
+    state = hass.states.get(entity_id)
+    assert state.attributes["state_class"] == "total_increasing"
+    assert state.attributes["device_class"] == "energy"
+    assert state.attributes["unit_of_measurement"] == "Wh"
+
+
+def test_restore_starts_a_new_segment():
+    """The time between the restored total and the next sample adds no area."""
+    stage = IntegrationStage("integration", None, INTEGRATION_METHOD_TRAPEZOIDAL)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    stage.async_push(1000.0, start)
+    stage.async_push(1000.0, start + timedelta(hours=1))
+    assert stage.value == 1000.0
+
+    # A larger total published half an hour in, restored after a restart
+    stage.restore(
+        2000.0, {"integrated_until": (start + timedelta(minutes=30)).isoformat()}
+    )
+    stage.async_push(1000.0, start + timedelta(hours=3))
+    assert stage.value == 2000.0
+
+    stage.async_push(1000.0, start + timedelta(hours=4))
+    assert stage.value == 3000.0
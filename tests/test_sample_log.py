@@ -0,0 +1,68 @@
+"""Tests for the raw sample log shared by entries on the same inputs."""
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.smoothing_analytics_sensors.const import DOMAIN
+
+
+def _add_entry(hass, sample_log_size):
+    """Add a config entry on the power sensor with a sample log."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        version=3,
+        data={"input_sensor": ["sensor.power"], "sample_log_size": sample_log_size},
+    )
+    entry.add_to_hass(hass)
+    return entry
+
+
+async def test_entries_sharing_an_input_share_the_largest_log(hass, tmp_path):
+    """Entries sharing the input stage log to one file sized for all of them."""
+    hass.config.config_dir = str(tmp_path)
+    hass.states.async_set("sensor.power", "100")
+    first_entry = _add_entry(hass, 100)
+    second_entry = _add_entry(hass, 500)
+
+    assert await hass.config_entries.async_setup(first_entry.entry_id)
+    await hass.async_block_till_done()
+
+    manager = hass.data[DOMAIN]
+    input_stage = manager.pipelines[first_entry.entry_id].input_stage
+    assert manager.pipelines[second_entry.entry_id].input_stage is input_stage
+    assert input_stage.sample_log.capacity == 500
+
+    hass.states.async_set("sensor.power", "200")
+    await hass.async_block_till_done()
+    assert input_stage.sample_log.read()[-1][1] == 200.0
+
+    # The log stays with the stage when the entry that opened it is removed
+    assert await hass.config_entries.async_unload(first_entry.entry_id)
+    await hass.async_block_till_done()
+    assert manager.pipelines[second_entry.entry_id].input_stage is input_stage
+
+    hass.states.async_set("sensor.power", "300")
+    await hass.async_block_till_done()
+    assert input_stage.sample_log.read()[-1][1] == 300.0
+
+
+async def test_log_grows_for_a_larger_entry(hass, tmp_path):
+    """An entry asking for a larger log grows the shared log, keeping its samples."""
+    hass.config.config_dir = str(tmp_path)
+    hass.states.async_set("sensor.power", "100")
+    first_entry = _add_entry(hass, 100)
+
+    assert await hass.config_entries.async_setup(first_entry.entry_id)
+    await hass.async_block_till_done()
+
+    hass.states.async_set("sensor.power", "200")
+    await hass.async_block_till_done()
+
+    second_entry = _add_entry(hass, 500)
+    assert await hass.config_entries.async_setup(second_entry.entry_id)
+    await hass.async_block_till_done()
+
+    sample_log = (
+        hass.data[DOMAIN].pipelines[second_entry.entry_id].input_stage.sample_log
+    )
+    assert sample_log.capacity == 500
+    assert [value for _, value in sample_log.read()] == [200.0]
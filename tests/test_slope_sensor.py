@@ -0,0 +1,30 @@
+"""Tests for the slope sensor."""
+
+from homeassistant.helpers import entity_registry as er
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.smoothing_analytics_sensors.const import DOMAIN
+
+
+async def test_slope_sensor_is_a_measurement_without_device_class(hass):
+    """The slope of a power sensor gets long-term statistics, but is no power."""
+    hass.states.async_set(
+        "sensor.power", "100", {"unit_of_measurement": "W", "device_class": "power"}
+    )
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        version=3,
+        data={"input_sensor": ["sensor.power"], "slope_window": 60},
+    )
+    entry.add_to_hass(hass)
+
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    entity_id = er.async_get(hass).async_get_entity_id(
+        "sensor", DOMAIN, f"sas_slope_{entry.entry_id}"
+    )
+    state = hass.states.get(entity_id)
+    assert state.attributes["state_class"] == "measurement"
+    assert state.attributes["unit_of_measurement"] == "W/s"
+    assert "device_class" not in state.attributes